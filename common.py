@@ -3,6 +3,7 @@ import os
 import shutil
 import re
 import json
+import sqlite3
 import xisf
 
 import zipfile
@@ -10,6 +11,8 @@ from astropy.io import fits
 from io import BytesIO
 
 from astropy.io import fits
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 from datetime import datetime, timedelta
 
@@ -429,6 +432,84 @@ def track_scheduler_changes(conn, initial_changes: int, dryrun: bool = False): #
         # Note: caller must commit after this call
 
 
+def tune_connection(conn, wal=True): # pragma: no cover
+    """
+    Apply performance PRAGMAs to a sqlite3 connection.
+
+    WAL with synchronous=NORMAL avoids an fsync per commit, and the larger
+    page cache plus mmap keep scan-heavy scripts from refilling the default
+    2 MB cache.  Safe to call on every connection; the settings only matter
+    for scripts that read or write heavily.
+
+    Args:
+        conn: SQLite connection object
+        wal: Use the persistent WAL journal.  Pass False for databases whose
+            file is synced as-is (the Dropbox-hosted astrophotography db),
+            where commits must land in the main file instead of a -wal
+            sidecar; since WAL sticks to the file, False also reverts a flip
+            left behind by an earlier run.
+    """
+    journal_mode = "WAL" if wal else "DELETE"
+    conn.executescript(f"""
+        PRAGMA journal_mode={journal_mode};
+        PRAGMA synchronous=NORMAL;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA cache_size=-262144;
+        PRAGMA mmap_size=268435456;
+    """)
+
+
+def _ensure_indexes(conn, indexes: dict): # pragma: no cover
+    """
+    Create any missing indexes from a name -> CREATE INDEX statement dict.
+    Runs ANALYZE only when something was actually created so repeat runs
+    are free.
+
+    Args:
+        conn: SQLite connection object
+        indexes: Mapping of index name to its CREATE INDEX statement
+    """
+    cursor = conn.cursor()
+    created = False
+    for name, stmt in indexes.items():
+        cursor.execute("select 1 from sqlite_master where type='index' and name=?", (name,))
+        if cursor.fetchone() is None:
+            cursor.execute(stmt)
+            created = True
+    if created:
+        cursor.execute("ANALYZE")
+        conn.commit()
+
+
+def ensure_scheduler_indexes(conn): # pragma: no cover
+    """
+    Create the covering indexes the scheduler scripts join on, if missing.
+    Turns the per-row exposureplan/exposuretemplate/project filters from
+    table scans into index seeks.
+
+    Args:
+        conn: SQLite connection to the scheduler database
+    """
+    _ensure_indexes(conn, {
+        "idx_ep_prof_tpl_tgt": "CREATE INDEX idx_ep_prof_tpl_tgt ON exposureplan(profileid, exposuretemplateid, targetid, exposure)",
+        "idx_et_prof_name": "CREATE INDEX idx_et_prof_name ON exposuretemplate(profileid, name)",
+        "idx_project_prof_name": "CREATE INDEX idx_project_prof_name ON project(profileid, name)",
+        "idx_rw_proj": "CREATE INDEX idx_rw_proj ON ruleweight(projectid)",
+    })
+
+
+def ensure_astrophotography_indexes(conn): # pragma: no cover
+    """
+    Create the covering index for accepted_data lookups, if missing.
+
+    Args:
+        conn: SQLite connection to the astrophotography database
+    """
+    _ensure_indexes(conn, {
+        "idx_accepted_data_lookup": "CREATE INDEX idx_accepted_data_lookup ON accepted_data(target_id, camera_id, optic_id, filter_id, shutter_time_seconds)",
+    })
+
+
 def backup_scheduler_database(): # pragma: no cover
     """
     Creates a backup of the NINA Scheduler database to Dropbox.
@@ -436,6 +517,14 @@ def backup_scheduler_database(): # pragma: no cover
     # create backup path
     Path(os.sep.join(BACKUP_TARGET_SCHEDULER.split(os.sep)[:-1])).mkdir(parents=True, exist_ok=True)
 
+    # under WAL the latest commits live in the -wal sidecar; checkpoint them
+    # into the main file first or the copy below silently misses them
+    conn = sqlite3.connect(DATABASE_TARGET_SCHEDULER)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+    finally:
+        conn.close()
+
     # _copy_ the file
     shutil.copy2(DATABASE_TARGET_SCHEDULER, BACKUP_TARGET_SCHEDULER)
 
@@ -603,9 +692,11 @@ def copy_file(from_file: str, to_file: str, debug=False, dryrun=False): # pragma
         shutil.copy2(from_file, to_file)
 
 
-def get_filtered_metadata(dirs: list, filters: dict, profileFromPath: bool, patterns=[r".*\.fits$"], recursive=False, required_properties=[], debug=False, printStatus=False):
+def get_filtered_metadata(dirs: list, filters: dict, profileFromPath: bool, patterns=[r".*\.fits$"], recursive=False, required_properties=[], debug=False, printStatus=False, filenames=None, workers=None):
     """
     Loads metadata for files in given directories, then filters the metadata based on provided filters and required properties.
+    If 'filenames' is provided the directory walk is skipped and only those files are considered.
+    If 'workers' is greater than 1, header enrichment is spread across that many processes.
     """
 
     if required_properties is None:
@@ -623,6 +714,8 @@ def get_filtered_metadata(dirs: list, filters: dict, profileFromPath: bool, patt
         debug=debug,
         printStatus=printStatus,
         profileFromPath=profileFromPath,
+        filenames=filenames,
+        workers=workers,
     )
 
     metadata = filter_metadata(
@@ -667,9 +760,11 @@ def get_filenames(dirs: list, patterns=[r".*\.fits$"], recursive=False, zips=Fal
     return filenames
 
 
-def get_metadata(dirs: list, profileFromPath: bool, patterns=[r".*\.fits$"], recursive=False, required_properties=[], debug=False, printStatus=False):
+def get_metadata(dirs: list, profileFromPath: bool, patterns=[r".*\.fits$"], recursive=False, required_properties=[], debug=False, printStatus=False, filenames=None, workers=None):
     """
     Loads metadata for files in the given directories, ensuring all required properties are present.
+    If 'filenames' is provided the directory walk is skipped and only those files are considered.
+    If 'workers' is greater than 1, header enrichment is spread across that many processes.
     Optionally prints status updates.
     """
     _required_properties = list(required_properties)
@@ -685,11 +780,12 @@ def get_metadata(dirs: list, profileFromPath: bool, patterns=[r".*\.fits$"], rec
     if printStatus:
         print("Loading data..", end=".", flush=True)
 
-    filenames = get_filenames(
-        dirs=dirs,
-        patterns=patterns,
-        recursive=recursive,
-    )
+    if filenames is None:
+        filenames = get_filenames(
+            dirs=dirs,
+            patterns=patterns,
+            recursive=recursive,
+        )
 
     for filename in filenames:
         d = get_file_headers(filename, profileFromPath=profileFromPath)
@@ -714,12 +810,23 @@ def get_metadata(dirs: list, profileFromPath: bool, patterns=[r".*\.fits$"], rec
         debug=debug,
         printStatus=printStatus,
         profileFromPath=profileFromPath,
+        workers=workers,
     )
 
 
-def enrich_metadata(data: dict, profileFromPath: bool, required_properties=[], debug=False, printStatus=False):
+def _enrich_file(filename: str, profileFromPath: bool): # pragma: no cover
+    """
+    Parse one file's headers.  Module level so process pool workers can pickle it.
+    """
+    if filename.endswith(".fits"):
+        return filename, get_fits_headers(filename, normalize=True, file_naming_override=True, profileFromPath=profileFromPath)
+    return filename, get_xisf_headers(filename, normalize=True, file_naming_override=True, profileFromPath=profileFromPath)
+
+
+def enrich_metadata(data: dict, profileFromPath: bool, required_properties=[], debug=False, printStatus=False, workers=None):
     """
     Enriches metadata for files missing required properties by extracting additional headers from the files themselves.
+    If 'workers' is greater than 1, the per-file header parsing is spread across that many processes.
     Optionally prints status updates.
     """
     # list of filenames (key of data dict) that need enrichment
@@ -736,6 +843,23 @@ def enrich_metadata(data: dict, profileFromPath: bool, required_properties=[], d
 
     to_enrich.sort()
 
+    if workers is not None and workers > 1:
+        # header parsing is per-file with no cross-file dependencies, so fan
+        # it out; other file types keep the serial default-location handling
+        parsable = [f for f in to_enrich if f.endswith((".fits", ".xisf"))]
+        to_enrich = [f for f in to_enrich if not f.endswith((".fits", ".xisf"))]
+        if parsable:
+            count_enriched = 0
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for filename, enriched in executor.map(partial(_enrich_file, profileFromPath=profileFromPath), parsable, chunksize=64):
+                    data[filename] = enriched
+                    count_enriched += 1
+                    if printStatus and count_enriched % 50 == 0:
+                        # print a period every 50 files just to have a visual.
+                        print("", end=".", flush=True)
+            if printStatus:
+                print("")
+
     # variables for printing status, if desired
     last_profilename = None
     last_targetname = None
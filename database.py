@@ -10,7 +10,8 @@ import sys
 import traceback
 import xmltodict
 import sqlite3
-import yaml
+
+from functools import lru_cache
 
 import common
 
@@ -37,10 +38,37 @@ class Database():
             self.curr = self.conn.cursor()
             self.conn.execute("PRAGMA case_sensitive_like=ON")
 
-    def execute(self, stmt:str):
+    def __enter__(self):
+        # context manager so several passes can share one open connection
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def execute(self, stmt:str, params=None):
         if not self.dryrun:
             try:
-                self.curr.execute(stmt)
+                if params is None:
+                    self.curr.execute(stmt)
+                else:
+                    # bound parameters let sqlite reuse the cached statement plan
+                    self.curr.execute(stmt, params)
+            except Exception as e:
+                print(f"ERROR executing statement\n{stmt}")
+                raise e
+            return self.curr.fetchall()
+        else:
+            return stmt
+
+    def executemany(self, stmt:str, params_list):
+        """
+        Execute one parameterized statement for many parameter rows.
+        The statement is parsed once and bound per row.
+        """
+        if not self.dryrun:
+            try:
+                self.curr.executemany(stmt, params_list)
             except Exception as e:
                 print(f"ERROR executing statement\n{stmt}")
                 raise e
@@ -145,18 +173,19 @@ class Database():
         """
         return f"select {','.join(columns)} from {table} where {self._make_where(where)};"
 
-    def select(self, stmt: str, columns: list[str]) -> list[dict]:
+    def select(self, stmt: str, columns: list[str], params=None) -> list[dict]:
         """
         Execute a SELECT statement and return the results as a list of dictionaries.
 
         Args:
             stmt (str): The SELECT statement to execute.
             columns (list): A list of column names.
+            params (tuple): Optional bound parameters for the statement.
 
         Returns:
             list: A list of dictionaries representing the query results.
         """
-        rows = self.execute(stmt)
+        rows = self.execute(stmt, params=params)
         if self.dryrun:
             # simply return the raw response, which will be the generated statement
             return rows
@@ -169,6 +198,41 @@ class Database():
                 output.append(f)
         return output
 
+    def select_iter(self, stmt: str, columns: list[str], params=None, arraysize=1000):
+        """
+        Execute a SELECT statement and yield the results as dictionaries,
+        fetching rows in batches so the full result set is never materialized.
+
+        Args:
+            stmt (str): The SELECT statement to execute.
+            columns (list): A list of column names.
+            params (tuple): Optional bound parameters for the statement.
+            arraysize (int): Number of rows fetched from the cursor per batch.
+
+        Yields:
+            dict: One dictionary per result row.
+        """
+        if self.dryrun:
+            return
+        try:
+            self.curr.arraysize = arraysize
+            if params is None:
+                self.curr.execute(stmt)
+            else:
+                self.curr.execute(stmt, params)
+        except Exception as e:
+            print(f"ERROR executing statement\n{stmt}")
+            raise e
+        while True:
+            rows = self.curr.fetchmany()
+            if not rows:
+                break
+            for row in rows:
+                f = {}
+                for i, c in enumerate(columns):
+                    f[c] = row[i]
+                yield f
+
     def insert_stmt(self, table: str, values: dict[str, str], ignoreErrors=False):
         """
         Generate an INSERT statement.
@@ -331,6 +395,27 @@ class Astrophotgraphy(Database):
                                 );""",
         "CREATE UNIQUE INDEX IF NOT EXISTS accepted_data1 ON accepted_data(camera_id,optic_id,location_id,target_id,filter_id,date,panel_name,shutter_time_seconds,raw_directory);",
         "CREATE UNIQUE INDEX IF NOT EXISTS accepted_data2 ON accepted_data(raw_directory);",
+        # full text index over raw_directory path segments so reports can match a
+        # directory token (e.g. "20_Data") without a full table scan via LIKE '%...%'.
+        # tokenchars keeps "_" inside tokens so state directory names stay whole.
+        """CREATE VIRTUAL TABLE IF NOT EXISTS accepted_data_fts USING fts5(
+                                    raw_directory,
+                                    content='accepted_data',
+                                    content_rowid='id',
+                                    tokenize = "unicode61 tokenchars '_'"
+                                );""",
+        """CREATE TRIGGER IF NOT EXISTS accepted_data_fts_ai AFTER INSERT ON accepted_data BEGIN
+                                    INSERT INTO accepted_data_fts(rowid, raw_directory) VALUES (new.id, new.raw_directory);
+                                END;""",
+        """CREATE TRIGGER IF NOT EXISTS accepted_data_fts_ad AFTER DELETE ON accepted_data BEGIN
+                                    INSERT INTO accepted_data_fts(accepted_data_fts, rowid, raw_directory) VALUES ('delete', old.id, old.raw_directory);
+                                END;""",
+        """CREATE TRIGGER IF NOT EXISTS accepted_data_fts_au AFTER UPDATE OF raw_directory ON accepted_data BEGIN
+                                    INSERT INTO accepted_data_fts(accepted_data_fts, rowid, raw_directory) VALUES ('delete', old.id, old.raw_directory);
+                                    INSERT INTO accepted_data_fts(rowid, raw_directory) VALUES (new.id, new.raw_directory);
+                                END;""",
+        # backfill the index for databases that existed before the fts table (idempotent)
+        "INSERT INTO accepted_data_fts(accepted_data_fts) VALUES ('rebuild');",
     ]
 
     defaultLocations = [
@@ -461,8 +546,8 @@ class Astrophotgraphy(Database):
         for filename in filenames:
             with open(filename, "r") as fd:
                 try:
-                    xml_dump = json.dumps(xmltodict.parse(fd.read()), indent=4)
-                    xml_data = yaml.safe_load(xml_dump)
+                    # xmltodict.parse already returns the nested dict shape we want
+                    xml_data = xmltodict.parse(fd.read())
                     profile_id = xml_data["Profile"]["Id"]
                     profile_name = xml_data["Profile"]["Name"]
 
@@ -860,7 +945,52 @@ class Astrophotgraphy(Database):
         else:
             print("DRYRUN: not(Updating database)")
 
+    def GetHaveHours(self, from_dir:str) -> dict:
+        """
+        Get accepted (have) hours per target directory, aggregated by the
+        database with SUM/GROUP BY instead of per-row arithmetic in Python.
+
+        Args:
+            from_dir (str): Directory prefix limiting the accepted data.
+
+        Returns:
+            dict: target_directory -> {(filter_name, panel_name): hours}.
+        """
+        output = {}
+
+        # same profile restriction as the summary select so both passes see
+        # the same rows; the target directory is everything before 'accept'
+        select_stmt = """
+            select substr(a.raw_directory, 1, instr(a.raw_directory, ?) - 2),
+                f.name, a.panel_name,
+                sum(a.accepted_count * a.shutter_time_seconds) / 3600.0
+            from accepted_data a, filter f, optic o, camera c, profile p
+            where f.id=a.filter_id
+            and o.id=a.optic_id
+            and c.id=a.camera_id
+            and p.optic_id=o.id
+            and p.camera_id=c.id
+            and a.raw_directory like ?
+            group by 1, 2, 3
+            ;"""
+        data = self.select(
+            stmt=select_stmt,
+            columns=['target_directory', 'filter_name', 'panelname', 'hours'],
+            params=(common.DIRECTORY_ACCEPT, from_dir + "%"),
+        )
+        for datum in data:
+            if datum['target_directory'] not in output:
+                output[datum['target_directory']] = {}
+            output[datum['target_directory']][(datum['filter_name'], datum['panelname'])] = datum['hours']
+
+        return output
+
 class Scheduler(Database):
+    @lru_cache(maxsize=1024)
+    def _normalize_target(self, name:str) -> str:
+        # memoized, the scheduler hits the same targets repeatedly across filters/sessions
+        return self.normalize_str(name)
+
     def GetDesiredHours(self, profile_id:str, targetname:str) -> float:
         output = {}
 
@@ -869,7 +999,7 @@ class Scheduler(Database):
             from exposuretemplate et, exposureplan ep, target t
             where et.id=ep.exposuretemplateid
             and ep.targetid=t.id
-            and t.name='{self.normalize_str(targetname)}'
+            and t.name='{self._normalize_target(targetname)}'
             and et.profileid='{profile_id}'
             order by et.name
             ;"""
@@ -880,4 +1010,51 @@ class Scheduler(Database):
         for datum in data:
             output[datum['filtername']] = datum['defaultexposure'] * datum['desired'] / 60 / 60
 
+        return output
+
+    def GetDesiredHoursBulk(self, pairs: list[tuple[str, str]], db=None, schema="") -> dict:
+        """
+        Get desired hours for many (profile_id, targetname) pairs in one pass
+        instead of one query per target.
+
+        Args:
+            pairs (list): (profile_id, targetname) tuples to look up.
+            db (Database): Optional connection to run the query on, e.g. a
+                connection with this scheduler database attached.
+            schema (str): Table prefix when querying through an attached
+                connection (e.g. "ts.").
+
+        Returns:
+            dict: (profile_id, targetname) -> {filtername: hours}.
+        """
+        if db is None:
+            db = self
+        output = {}
+
+        # sqlite caps bound parameters at 999 per statement, 2 per pair
+        CHUNK = 400
+        pairs = list(dict.fromkeys(pairs))
+        for i in range(0, len(pairs), CHUNK):
+            chunk = pairs[i:i+CHUNK]
+            values = ",".join(["(?,?)"] * len(chunk))
+            select_stmt = f"""
+                select et.profileid, t.name, et.name, et.defaultexposure, ep.desired
+                from {schema}exposuretemplate et, {schema}exposureplan ep, {schema}target t
+                where et.id=ep.exposuretemplateid
+                and ep.targetid=t.id
+                and (et.profileid, t.name) in (values {values})
+                order by et.name
+                ;"""
+            params = [v for pair in chunk for v in pair]
+            data = db.select(
+                stmt=select_stmt,
+                columns=['profile_id', 'targetname', 'filtername', 'defaultexposure', 'desired'],
+                params=params,
+            )
+            for datum in data:
+                key = (datum['profile_id'], datum['targetname'])
+                if key not in output:
+                    output[key] = {}
+                output[key][datum['filtername']] = datum['defaultexposure'] * datum['desired'] / 60 / 60
+
         return output
\ No newline at end of file
@@ -16,7 +16,6 @@ import os
 import sys
 from datetime import date
 import xmltodict
-import yaml
 
 import common
 
@@ -82,14 +81,11 @@ def extract_filters_from_profile(xml_data):
                 infos = [infos]
             
             for info in infos:
-                f = common.normalize_filterName(info['a:_name'])
-                # skip any "DARK" filter
-                if f.upper().startswith("DARK"):
+                raw = info['a:_name']
+                # skip any "DARK" or "BLANK" filter, only normalize filters we keep
+                if raw.upper().startswith(("DARK", "BLANK")):
                     continue
-                # skip any "BLANK" filter
-                if f.upper().startswith("BLANK"):
-                    continue
-                filters.append(f)
+                filters.append(common.normalize_filterName(raw))
     return filters
 
 
@@ -180,18 +176,10 @@ def hash_profile(profile):
 
 def reorder_profile_dict(profile):
     """Reorder profile dict to ensure profile_id and profile_name are first."""
-    # Extract profile_id and profile_name first
-    ordered_profile = {
-        "profile_id": profile["profile_id"],
-        "profile_name": profile["profile_name"]
-    }
-    
-    # Add all other fields in their current order
-    for key, value in profile.items():
-        if key not in ["profile_id", "profile_name"]:
-            ordered_profile[key] = value
-    
-    return ordered_profile
+    # Rely on dict insertion order - pop the two keys and re-insert them first
+    profile_id = profile.pop("profile_id")
+    profile_name = profile.pop("profile_name")
+    return {"profile_id": profile_id, "profile_name": profile_name, **profile}
 
 
 def merge_profile_data(config, profile_id, profile_name, filters):
@@ -277,9 +265,9 @@ def extract_profile(profile_path):
     
     with open(profile_path, "r", encoding="utf-8") as fd:
         try:
-            xml_dump = json.dumps(xmltodict.parse(fd.read()), indent=4)
-            xml_data = yaml.safe_load(xml_dump)
-            
+            # xmltodict.parse already returns the nested dict shape we want
+            xml_data = xmltodict.parse(fd.read())
+
             profile_id = xml_data["Profile"]["Id"]
             profile_name = xml_data["Profile"]["Name"]
             filters = extract_filters_from_profile(xml_data)
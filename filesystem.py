@@ -6,6 +6,7 @@ It includes functionality for handling input and output directories and file pat
 import os
 import pathlib
 import re
+import sys
 
 import common
 
@@ -30,6 +31,21 @@ class Prepare():
         self.output_dir_light = output_dir_light
         self.debug=debug
         self.dryrun=dryrun
+        # candidate files per walk mode, so bias/dark/flat/light share one scan
+        self._candidates = {}
+
+    def _get_candidates(self, recursive:bool):
+        if recursive not in self._candidates:
+            self._candidates[recursive] = common.get_filenames(
+                dirs=[self.input_dir],
+                patterns=[self.input_pattern],
+                recursive=recursive,
+            )
+        return self._candidates[recursive]
+
+    def _prune_candidates(self, recursive:bool, processed):
+        # processed files were moved or deleted, drop them from the cached scan
+        self._candidates[recursive] = [f for f in self._candidates[recursive] if f not in processed]
 
     def _prepare(self, type:str, output_dir:str, recursive=False, printStatus=False):
         # set required properties based on the image type
@@ -52,6 +68,7 @@ class Prepare():
             debug=self.debug,
             profileFromPath=False,
             printStatus=printStatus,
+            filenames=self._get_candidates(recursive),
         )
 
         if printStatus:
@@ -61,14 +78,20 @@ class Prepare():
         target_dirs = set()
         count_files=0 # could use len but assuming this is faster
 
+        # the whole run is filter-locked to one type, decide statedir once instead of per file
+        statedir = common.DIRECTORY_BLINK if type == 'LIGHT' else None
+
+        # avoid print() overhead and a flush syscall per progress dot
+        _stdout_write = sys.stdout.write
+
         for datum in data.values():
             filename_src=datum['filename']
-            statedir=None
+            # files can still be missing 'type' after enrichment (no IMAGETYP
+            # header, or the non-FITS fallback path); skip them instead of
+            # letting normalize_filename abort the whole move run
             if 'type' not in datum:
                 print(f"WARNING: type not set in datum, skipping: {datum}")
                 continue
-            if datum['type'] == 'LIGHT':
-                statedir = common.DIRECTORY_BLINK
             filename_dest=common.normalize_filename(
                 output_directory=output_dir,
                 input_filename=filename_src,
@@ -85,14 +108,19 @@ class Prepare():
 
             count_files += 1
             if printStatus and count_files % 50 == 0:
-                print(".", end="", flush=True)
+                _stdout_write(".")
+                if count_files % 200 == 0:
+                    sys.stdout.flush()
 
             for t in re.findall("(.*)[\\\\\\/]DATE.*", filename_dest):
                 if t not in target_dirs and not self.dryrun:
                     # create the accept directory as we go, more idempotent overall (resiliant to failures)
                     pathlib.Path(t+os.sep+common.DIRECTORY_ACCEPT).mkdir(parents=True, exist_ok=True)
                 target_dirs.add(t)
-        
+
+        if not self.dryrun:
+            self._prune_candidates(recursive, set(data.keys()))
+
         if printStatus:
             print("\n")
         
@@ -140,6 +168,21 @@ class Delete():
         self.input_pattern = input_pattern
         self.debug=debug
         self.dryrun=dryrun
+        # candidate files per walk mode, so bias/dark/flat share one scan
+        self._candidates = {}
+
+    def _get_candidates(self, recursive:bool):
+        if recursive not in self._candidates:
+            self._candidates[recursive] = common.get_filenames(
+                dirs=[self.input_dir],
+                patterns=[self.input_pattern],
+                recursive=recursive,
+            )
+        return self._candidates[recursive]
+
+    def _prune_candidates(self, recursive:bool, processed):
+        # processed files were deleted, drop them from the cached scan
+        self._candidates[recursive] = [f for f in self._candidates[recursive] if f not in processed]
 
     def _delete(self, type: str, recursive: bool = False, printStatus: bool = False):
         """
@@ -173,6 +216,7 @@ class Delete():
             debug=self.debug,
             profileFromPath=False,
             printStatus=printStatus,
+            filenames=self._get_candidates(recursive),
         )
 
         if printStatus:
@@ -184,7 +228,10 @@ class Delete():
                 print(f"    {filename_src}")
             if not self.dryrun:
                 pathlib.Path(filename_src).unlink()
-        
+
+        if not self.dryrun:
+            self._prune_candidates(recursive, set(data.keys()))
+
         # Place a ".keep" file in any directories to retain for management purposes.
         common.delete_empty_directories(os.path.join(self.input_dir), dryrun=self.dryrun)
 
@@ -3,14 +3,31 @@ This module provides a class to represent and manage location data for astrophot
 It includes attributes for latitude, longitude, and other location-specific details.
 """
 
+import json
+import os
 import re
+import threading
 import time
 import traceback
-import requests 
+import requests
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 import common
 import database
 
+# compile once at module load, loadData runs these per response line
+_TAG_RE = re.compile(r'<.*?>')
+_BORTLE_RE = re.compile(r'.*Sky Quality: ([.0-9]*) Magnitude.*Class ([0-9]*) Bortle\. ([.0-9]*) mcd/m2 Brightness\. ([.0-9]*) μcd/m2 Artificial')
+
+# share one session so TCP+TLS connections are pooled across loadData calls
+_SESSION = requests.Session()
+
+# sky quality at a fixed lat/lon changes rarely, cache API responses on disk
+_CACHE_DIR = os.path.join(Path.home(), ".cache", "astrophot")
+_CACHE_TTL_SECONDS = 86400
+
 class Location():
     name = ""
     latitude = ""
@@ -33,65 +50,110 @@ class Location():
         self.latitude = latitude
         self.longitude = longitude
 
-    def loadData(self):
+    def _cache_filename(self):
+        return os.path.join(_CACHE_DIR, f"location_{self.latitude}_{self.longitude}.json")
+
+    def loadFromCache(self):
+        """
+        Try to populate location data from the on-disk cache.
+
+        Returns:
+            bool: True if a fresh cache entry was loaded, False otherwise.
+        """
+        try:
+            with open(self._cache_filename(), "r") as f:
+                cached = json.load(f)
+            if time.time() - cached["ts"] >= _CACHE_TTL_SECONDS:
+                return False
+            self.magnitude = cached["magnitude"]
+            self.bortle = cached["bortle"]
+            self.brightness = cached["brightness"]
+            self.artifical_brightness = cached["artifical_brightness"]
+            return True
+        except (OSError, ValueError, KeyError):
+            # missing or unreadable cache entry, fall back to the API
+            return False
+
+    def _saveToCache(self):
+        try:
+            Path(_CACHE_DIR).mkdir(parents=True, exist_ok=True)
+            with open(self._cache_filename(), "w") as f:
+                json.dump({
+                    "magnitude": self.magnitude,
+                    "bortle": self.bortle,
+                    "brightness": self.brightness,
+                    "artifical_brightness": self.artifical_brightness,
+                    "ts": time.time(),
+                }, f)
+        except OSError:
+            # cache is best effort, never fail the load over it
+            pass
+
+    def loadData(self, session: requests.Session = None):
         """
         Load location data from an external API and parse relevant details.
 
         Retrieves data such as magnitude, Bortle class, brightness, and artificial brightness
         from the Clear Outside API based on the location's latitude and longitude.
 
+        Args:
+            session (requests.Session): Optional session to reuse connections across calls.
+
         Raises:
             Exception: If the API response status code is not 200.
         """
-        r = requests.get(f"https://clearoutside.com/forecast/{self.latitude}/{self.longitude}")
-        if r.status_code != 200:
-            print(f"ERROR status code: {r.status_code}")
-            return
-
-        cleaner_regex = re.compile('<.*?>')
-        for line in r.text.splitlines():
-            if "Bortle" in line:
+        if session is None:
+            session = _SESSION
+        # stream so only one line is held in memory and we can stop at the match
+        with session.get(f"https://clearoutside.com/forecast/{self.latitude}/{self.longitude}", stream=True, timeout=30) as r:
+            if r.status_code != 200:
+                print(f"ERROR status code: {r.status_code}")
+                return
+
+            for line in r.iter_lines(decode_unicode=True):
+                # only one line of the response matters
                 # <span class="btn btn-primary btn-bortle-5"><span class="glyphicon glyphicon-eye-open" style="top: 2px;"></span> &nbsp; Est. Sky Quality: &nbsp;<strong>19.58</strong> Magnitude. &nbsp;<strong>Class 5</strong> Bortle. &nbsp;<strong>1.58</strong> mcd/m<sup>2</sup> Brightness. &nbsp;<strong>1412.91</strong> μcd/m<sup>2</sup> Artificial Brightness.</span>
-                cleanline = re.sub(cleaner_regex, '', line).replace("&nbsp;", "")
-                #   Est. Sky Quality: 19.58 Magnitude. Class 5 Bortle. 1.58 mcd/m2 Brightness. 1412.91 μcd/m2 Artificial Brightness.
-                m = re.match(".*Sky Quality: ([.0-9]*) Magnitude.*Class ([0-9]*) Bortle\. ([.0-9]*) mcd/m2 Brightness\. ([.0-9]*) μcd/m2 Artificial", cleanline)
-                self.magnitude = m.groups()[0]
-                self.bortle = m.groups()[1]
-                self.brightness = m.groups()[2]
-                self.artifical_brightness = m.groups()[3]
+                if line and "Sky Quality:" in line:
+                    cleanline = _TAG_RE.sub('', line).replace("&nbsp;", "")
+                    #   Est. Sky Quality: 19.58 Magnitude. Class 5 Bortle. 1.58 mcd/m2 Brightness. 1412.91 μcd/m2 Artificial Brightness.
+                    m = _BORTLE_RE.match(cleanline)
+                    self.magnitude = m.groups()[0]
+                    self.bortle = m.groups()[1]
+                    self.brightness = m.groups()[2]
+                    self.artifical_brightness = m.groups()[3]
+                    self._saveToCache()
+                    break
     
-    def location_upsert_stmt(self):
+    def location_upsert_params(self):
         """
-        Generate an SQL upsert statement for the location data.
+        Generate the bound parameters for the shared location upsert statement.
 
         Returns:
-            str: The SQL upsert statement for the location.
-        """
-        insert_values = {
-            "name": self.name,
-            "latitude": self.latitude,
-            "longitude": self.longitude,
-            "magnitude": self.magnitude,
-            "bortle": self.bortle,
-            "brightness_mcd_m2": self.brightness,
-            "artifical_brightness_ucd_m2": self.artifical_brightness,
-        }
-        update_values = {
-            "name": self.name,
-            "magnitude": self.magnitude,
-            "bortle": self.bortle,
-            "brightness_mcd_m2": self.brightness,
-            "artifical_brightness_ucd_m2": self.artifical_brightness,
-        }
-        # using the database object just for statement generation.. (HACK)
-        d = database.Database("")
-        return d.upsert_stmt(
-            table="location",
-            insert_values=insert_values,
-            update_values=update_values,
-            conflictColumns=['latitude', 'longitude'],
+            tuple: Values in LOCATION_UPSERT_SQL column order.
+        """
+        return (
+            self.name,
+            self.latitude,
+            self.longitude,
+            self.magnitude,
+            self.bortle,
+            self.brightness,
+            self.artifical_brightness,
         )
-      
+
+# one parameterized upsert shared by every location: one parse, N binds
+LOCATION_UPSERT_SQL = (
+    "insert into location (name,latitude,longitude,magnitude,bortle,brightness_mcd_m2,artifical_brightness_ucd_m2) "
+    "values (?,?,?,?,?,?,?) "
+    "on conflict (latitude,longitude) do update set "
+    "name=excluded.name,"
+    "magnitude=excluded.magnitude,"
+    "bortle=excluded.bortle,"
+    "brightness_mcd_m2=excluded.brightness_mcd_m2,"
+    "artifical_brightness_ucd_m2=excluded.artifical_brightness_ucd_m2,"
+    "last_updated_date=CURRENT_TIMESTAMP;"
+)
+
 class LocationControl():
     locations = [
         Location("RL", "35.6", "-78.8"),
@@ -109,31 +171,60 @@ class LocationControl():
         This class manages a list of predefined locations and provides methods
         to load data and generate SQL upsert statements for all locations.
         """
-        pass
+        self.session = requests.Session()
+        # minimum seconds between requests, the site is rate limited
+        self._min_interval = 15.0
+        self._last = 0.0
+        self._lock = threading.Lock()
 
-    def loadAllData(self):
+    def _rate_limit(self):
+        """
+        Sleep only for however much of the minimum interval is left since the
+        last request.  Time spent on network and parsing counts toward the wait.
+        Thread-safe so request starts stay spaced when loading in parallel.
+        """
+        with self._lock:
+            dt = time.monotonic() - self._last
+            if self._last > 0 and dt < self._min_interval:
+                wait = self._min_interval - dt
+                print(f"Sleeping for {wait:.1f} seconds.  The site is rate limited.")
+                time.sleep(wait)
+            self._last = time.monotonic()
+
+    def loadAllData(self, max_workers=2):
         """
         Load data for all locations in the list.
 
-        This method iterates through all locations, calls their `loadData` method,
-        and enforces a delay to respect API rate limits.
+        Requests are dispatched on a small thread pool so network wait overlaps
+        with parsing, while the rate limiter keeps request starts spaced out.
+        Use max_workers=1 to force strictly serial loading.
         """
-        for l in self.locations:
-            l.loadData()
-            print("Sleeping for 15 seconds.  The site is rate limited.")
-            time.sleep(15)
+        def _load(l):
+            if l.loadFromCache():
+                # cache hit, no network call and no rate-limit wait needed
+                return
+            self._rate_limit()
+            l.loadData(session=self.session)
+
+        if max_workers <= 1:
+            for l in self.locations:
+                _load(l)
+            return
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_load, l) for l in self.locations]
+            for future in futures:
+                # surface any exception from the worker
+                future.result()
     
-    def location_upsert_stmts(self):
+    def location_upsert_batch(self):
         """
-        Generate SQL upsert statements for all locations.
+        Generate the shared upsert statement and one parameter row per location.
 
         Returns:
-            list: A list of SQL upsert statements for all locations.
+            tuple: (sql, list of parameter tuples) for Database.executemany.
         """
-        output = []
-        for l in self.locations:
-            output.append(l.location_upsert_stmt())
-        return output
+        return LOCATION_UPSERT_SQL, [l.location_upsert_params() for l in self.locations]
 
 
 if __name__ == '__main__':
@@ -150,9 +241,9 @@ if __name__ == '__main__':
         l = LocationControl()
         l.loadAllData()
         d.open()
-        for upsert in l.location_upsert_stmts():
-            print(upsert)
-            d.execute(upsert)
+        sql, params_list = l.location_upsert_batch()
+        print(sql)
+        d.executemany(sql, params_list)
         d.commit()
     except Exception as e:
         print(e)
@@ -9,16 +9,20 @@ import psutil
 max_n=0
 
 # find maximum used "n" for PixInsight
-for p in psutil.process_iter():
-    if p.name() == "PixInsight.exe":
-        try:
-            for arg in p.cmdline():
-                if arg.startswith("-n=") or arg.startswith("--new="):
-                    n=int(arg[-arg.index("=")+1:])
-                    if n > max_n:
-                        max_n = n
-        except:
-            pass
+# attrs makes psutil take one process snapshot instead of per-process calls
+for p in psutil.process_iter(attrs=['name', 'cmdline']):
+    info = p.info
+    if info['name'] != "PixInsight.exe" or not info['cmdline']:
+        continue
+    for arg in info['cmdline']:
+        if arg.startswith(("-n=", "--new=")):
+            # everything after the first "=" is the instance number
+            try:
+                n = int(arg.partition("=")[2])
+            except ValueError:
+                continue
+            if n > max_n:
+                max_n = n
 
 print(f"INFO: max 'n' found is {max_n}, starting {max_n+1}")
 p = subprocess.Popen([r'C:\Program Files\PixInsight\bin\PixInsight.exe', f"-n={max_n+1}"])
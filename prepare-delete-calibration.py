@@ -4,9 +4,11 @@ It uses command-line arguments to specify input directories and enable debugging
 """
 
 import argparse
+import atexit
 import os
 import shutil
 import pathlib
+import threading
 
 import common
 import filesystem
@@ -36,7 +38,13 @@ p.bias()
 p.dark()
 p.flat()
 
-# special case, delete the calibration dir recursively and recreate it empty
-if not user_dryrun:
-    shutil.rmtree(user_calibration_dir)
-    pathlib.Path(user_calibration_dir).mkdir(parents=True, exist_ok=True)
\ No newline at end of file
+# special case, delete the calibration dir recursively and recreate it empty.
+# rename it aside first (one metadata op) so the fresh dir is available immediately,
+# then unlink the old tree off the critical path in a background thread.
+if not user_dryrun and os.path.isdir(user_calibration_dir):
+    tmp = f"{user_calibration_dir}.todelete-{os.getpid()}"
+    os.replace(user_calibration_dir, tmp)
+    pathlib.Path(user_calibration_dir).mkdir(parents=True, exist_ok=True)
+    cleanup = threading.Thread(target=shutil.rmtree, args=(tmp,), kwargs={"ignore_errors": True})
+    cleanup.start()
+    atexit.register(cleanup.join)
\ No newline at end of file
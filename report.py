@@ -4,11 +4,26 @@ It includes methods to query and process data for reporting purposes.
 """
 
 import os
-import re
 import traceback
 import common
 import database
 
+from functools import lru_cache
+
+@lru_cache(maxsize=None)
+def _targetname_for(data_dir: str) -> str:
+    """
+    Resolve the target name for a data directory, memoized so repeat report
+    runs in one process don't redo the header parsing per directory.
+    """
+    # NOTE append "accept" so objectFromPath works
+    return common.get_file_headers(
+        filename=data_dir+os.sep+common.DIRECTORY_ACCEPT,
+        profileFromPath=True,
+        objectFromPath=True,
+        normalize=True,
+    )['targetname']
+
 class Report():
     db_astrophotography = None
     db_scheduler = None
@@ -22,6 +37,8 @@ class Report():
         """
         self.db_astrophotography = database.Database(common.DATABASE_ASTROPHOTGRAPHY)
         self.db_scheduler = database.Database(common.DATABASE_TARGET_SCHEDULER)
+        # results per pattern, cached for the lifetime of this Report
+        self._findData_cache = {}
 
     def _findData(self, like: str):
         """
@@ -33,32 +50,78 @@ class Report():
         Returns:
             dict: A dictionary where keys are directory paths and values are aggregated counts.
         """
-        try:
-            self.db_astrophotography.open()
-            stmt = f"select sum(accepted_count), raw_directory from accepted_data where raw_directory like '%{like}%' group by raw_directory;"
-            data = self.db_astrophotography.select(
-                stmt=stmt,
-                columns=["accepted_count", "raw_directory"],
+        return self._findDataMulti([like])[like]
+
+    def refresh(self):
+        """
+        Clear the memoized folder results so the next call re-queries the database.
+        """
+        self._findData_cache = {}
+
+    def _hasSegmentIndex(self):
+        """
+        Check once whether the accepted_data_fts segment index exists.
+        Databases created before it was added won't have it.
+        """
+        if not hasattr(self, '_segment_index'):
+            rows = self.db_astrophotography.execute(
+                "select name from sqlite_master where type='table' and name='accepted_data_fts';"
             )
-            # raw directory is full path.  strip off everything "\accept\.*$".
-            output = {}
-            for datum in data:
-                m = re.match("(.*)[\\\\\\/]accept[\\\\\\/].*", datum['raw_directory'])
-                if m and len(m.groups()) == 1:
-                    dir = m.groups()[0]
-                    count = int(datum['accepted_count'])
-                    if dir in output:
-                        # existing data, add to accepted_count
-                        output[dir] += count
-                    else:
-                        # new data to aggregate, set to accepted_count
-                        output[dir] = count
-            return output
-        except Exception as e:
-            print(e)
-            traceback.print_exc()
-        finally:
-            self.db_astrophotography.close()
+            self._segment_index = len(rows) > 0
+        return self._segment_index
+
+    def _findDataMulti(self, likes: list[str]):
+        """
+        Query and aggregate data for several raw directory patterns in one pass.
+
+        Opens the database once and issues a single query covering every pattern
+        not already cached, so callers combining folders pay one roundtrip.
+
+        Args:
+            likes (list): String patterns to filter raw directories.
+
+        Returns:
+            dict: A dictionary keyed by pattern, each value a dict of directory to count.
+        """
+        missing = [like for like in likes if like not in self._findData_cache]
+        if missing:
+            try:
+                self.db_astrophotography.open()
+                # raw directory is full path.  strip off everything "\accept\.*$" and
+                # aggregate in sqlite rather than regex + dict post-processing per row.
+                # substr positions computed on the separator-normalized copy line up with
+                # the original string, so original separators are preserved in the key.
+                if self._hasSegmentIndex():
+                    # indexed path-segment match, avoids the full table scan of LIKE '%...%'
+                    where = "id in (select rowid from accepted_data_fts where accepted_data_fts match ?)"
+                    params = ('"' + '" OR "'.join(missing) + '"',)
+                else:
+                    # older database without the fts table, fall back to a scan
+                    where = "(" + " or ".join("raw_directory like ?" for _ in missing) + ")"
+                    params = tuple(f"%{like}%" for like in missing)
+                stmt = f"""select sum(accepted_count),
+                    substr(raw_directory, 1, instr(replace(raw_directory,'\\','/'),'/accept/')-1) as dir
+                    from accepted_data
+                    where {where}
+                    and instr(replace(raw_directory,'\\','/'),'/accept/') > 0
+                    group by dir;"""
+                data = self.db_astrophotography.select(
+                    stmt=stmt,
+                    columns=["accepted_count", "dir"],
+                    params=params,
+                )
+                for like in missing:
+                    self._findData_cache[like] = {}
+                for datum in data:
+                    for like in missing:
+                        if like in datum['dir']:
+                            self._findData_cache[like][datum['dir']] = int(datum['accepted_count'])
+            except Exception as e:
+                print(e)
+                traceback.print_exc()
+            finally:
+                self.db_astrophotography.close()
+        return {like: self._findData_cache[like] for like in likes}
 
     def data(self):
         """
@@ -117,31 +180,34 @@ class Report():
         try:
             self.db_scheduler.open()
 
-            ready2move_dirs = []
-
+            # resolve the target name for every directory up front
+            dir_targets = {}
             for data_dir in data_dirs:
-                # NOTE append "accept" so objectFromPath works
-                metadata = common.get_file_headers(
-                    filename=data_dir+os.sep+common.DIRECTORY_ACCEPT,
-                    profileFromPath=True,
-                    objectFromPath=True,
-                    normalize=True,
-                )
+                dir_targets[data_dir] = _targetname_for(data_dir)
+
+            if len(dir_targets) == 0:
+                return []
+
+            # fetch the exposure plans for all targets in one query instead of one per directory
+            likes = " or ".join(f"t.name like \"{targetname}%\"" for targetname in set(dir_targets.values()))
+            stmt = f"""
+                select ep.profileid, t.name, ep.desired, ep.acquired, ep.accepted
+                from exposureplan ep, target t
+                where ep.targetid = t.id
+                and ({likes})
+                ;"""
+            data = self.db_scheduler.select(
+                stmt=stmt,
+                columns=['profile_id', 'name', 'desired', 'acquired', 'accepted'],
+            )
 
-                # for the target, find all acquired data
-                stmt = f"""
-                    select ep.profileid, t.name, ep.desired, ep.acquired, ep.accepted
-                    from exposureplan ep, target t
-                    where ep.targetid = t.id
-                    and t.name like "{metadata['targetname']}%"
-                    ;"""
-                data = self.db_scheduler.select(
-                    stmt=stmt,
-                    columns=['profile_id', 'name', 'desired', 'acquired', 'accepted'],
-                )
+            ready2move_dirs = []
+
+            for data_dir, targetname in dir_targets.items():
                 # it is ready to move if all the exposure plans (datum) returned have accepted * 95% >= desired
-                is_ready = len(data) > 0
-                for datum in data:
+                plans = [datum for datum in data if datum['name'].startswith(targetname)]
+                is_ready = len(plans) > 0
+                for datum in plans:
                     if datum['desired'] > 0 and not (datum['accepted'] > datum['desired'] * common.MASTER_READY_PERCENT):
                         is_ready = False
                         break
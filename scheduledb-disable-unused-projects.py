@@ -45,22 +45,24 @@ try:
 
     # disable every project found.  NOTE this only works with the assumption that every project has one target.. this is valid at time of writing!
 
+    new_project_state=0
     for row_ts in rows_ts:
         project_id=row_ts[0]
         project_name=row_ts[1]
         targetname=row_ts[2]
         project_state=row_ts[3]
         profile_id=row_ts[4]
-        new_project_state=0
         print(f"update project state: {profile_id}/{project_name}/{targetname}: {project_state} --> {new_project_state}")
-        if not user_dryrun:
 
-            c_ts.execute(f"""update project
-                            set state='{new_project_state}'
-                            where id='{project_id}'
-                            ;""")
+    # one parameterized statement for all projects instead of one update per row
+    if not user_dryrun:
+        project_ids = [row_ts[0] for row_ts in rows_ts]
+        c_ts.execute(
+            f"update project set state=? where id in ({','.join('?' * len(project_ids))});",
+            [new_project_state] + project_ids,
+        )
 
-    common.track_scheduler_changes(conn_ts, __file__, initial_changes_ts, user_dryrun)
+    common.track_scheduler_changes(conn_ts, initial_changes_ts, user_dryrun)
     conn_ts.commit()
 
     common.backup_scheduler_database()
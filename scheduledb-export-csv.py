@@ -3,6 +3,8 @@ This script exports data from the NINA Scheduler database to a CSV file.
 It skips specific profiles based on predefined identifiers.
 """
 
+import argparse
+import multiprocessing
 import os
 import sqlite3
 import subprocess
@@ -11,6 +13,48 @@ import traceback
 
 import common
 
+parser = argparse.ArgumentParser(description="export desired CSV per profile")
+parser.add_argument("--open", action='store_true', help="open the exported CSVs in LibreOffice after the export finishes")
+
+# treat args parsed as a dictionary
+args = vars(parser.parse_args())
+
+user_open = args["open"]
+
+# one compile site per statement so sqlite reuses the compiled plan across rows
+# effective priority is computed in SQL: a priority-0 project whose panels
+# (projects sharing the target-name prefix, quotes stripped like
+# common.normalize_target_name) have no positive rule weight reports -1.
+SELECT_TARGETS_SQL = """select distinct p.profileid, t.name,
+                            case when p.priority = 0 and not exists (
+                                select 1
+                                from ruleweight rw, project p2
+                                where rw.projectid=p2.id
+                                and rw.weight > 0
+                                and p2.name like replace(replace(
+                                        case when instr(t.name, ' Panel ') > 0
+                                             then substr(t.name, 1, instr(t.name, ' Panel ')-1)
+                                             else t.name end,
+                                    '''', ''), '"', '') || '%'
+                            ) then -1 else p.priority end as priority
+                        from target t, project p
+                        where t.projectid=p.id
+                        and p.profileid=?
+                        and (p.state = 0 or p.state = 1)
+                        order by p.profileid, t.name
+                    ;"""
+
+# every (target, filter) exposure plan for a profile in one pass, instead of
+# one three-way join per target per filter
+SELECT_PLANS_SQL = """
+            select t.name, et.name, et.defaultexposure, ep.desired, ep.accepted
+            from exposureplan ep
+            join exposuretemplate et on et.id=ep.exposureTemplateId and et.profileid=ep.profileid
+            join target t on t.id=ep.targetid
+            where ep.exposure<0
+            and et.profileid=?
+            ;"""
+
 SKIP_PROFILES=[
     "7c504d1b-6d2d-4e1e-ba80-5615fcdfc814", # C8@f6.3+ZWO ASI2600MM Pro
     "f8cf2e6c-edc8-40bf-a5d4-c1d1edb05fd3", # 150PDS@f4.75+ZWO ASI2600MM Pro
@@ -22,70 +66,51 @@ SKIP_PROFILES=[
     "0b09bb0b-4bd8-40f1-b782-a1589f2a58cc", # SQA55@f4.8+SL2
 ]
 
-try:
-    conn_ts = sqlite3.connect(common.DATABASE_TARGET_SCHEDULER)
-    c_ts = conn_ts.cursor()
-    conn_ap = sqlite3.connect(common.DATABASE_ASTROPHOTGRAPHY)
-    c_ap = conn_ap.cursor()
 
-    # output the following:
-    # profile id, profile name, target name, filter, desired hours, accepted hours, exposureplan id
+def export_profile(row_ap):
+    """
+    Export the desired CSV for one profile.
+
+    Runs in a worker process with its own read-only scheduler connection, so
+    profiles export in parallel; WAL mode lets readers proceed concurrently.
 
-    # fetch profile data from the astrophotography database
-    c_ap.execute("select id, name, filter_names from profile;")
-    rows_ap = c_ap.fetchall()
-    if rows_ap is None or len(rows_ap) == 0:
-        print("ERROR no profiles found. Aborting.")
-        sys.exit(1)
+    Args:
+        row_ap: (id, name, filter_names) profile row from the astrophotography database.
 
-    for row_ap in rows_ap:
-        profile_id = row_ap[0]
-        profile_name = row_ap[1]
-        filter_names = row_ap[2].split(",")
+    Returns:
+        tuple: (csv filename or None, error message or None)
+    """
+    profile_id = row_ap[0]
+    profile_name = row_ap[1]
+    filter_names = row_ap[2].split(",")
 
-        if profile_id in SKIP_PROFILES:
-            #print(f"SKIPPING {profile_id}, {profile_name}")
-            continue
+    conn_ts = sqlite3.connect(f"file:{common.DATABASE_TARGET_SCHEDULER}?mode=ro", uri=True, cached_statements=256)
+    try:
+        c_ts = conn_ts.cursor()
+        c_ts.execute("PRAGMA cache_size=-262144;")
 
         # get all draft and active target data where also have an exposureplan
-        c_ts.execute(f"""select distinct p.profileid, t.name, p.priority
-                        from target t, project p
-                        where t.projectid=p.id
-                        and p.profileid='{profile_id}'
-                        and (p.state = 0 or p.state = 1)
-                        order by p.profileid, t.name
-                    ;""")
+        c_ts.execute(SELECT_TARGETS_SQL, (profile_id,))
 
         rows_ts = c_ts.fetchall()
         if rows_ts is None or len(rows_ts) == 0:
-            print(f"ERROR no exposure plans found for profile '{profile_id} / {profile_name}'. Aborting.")
-            sys.exit(1)
+            return None, f"no exposure plans found for profile '{profile_id} / {profile_name}'"
+
+        # fetch every exposure plan for the profile at once and look rows up by
+        # (target, filter) instead of issuing one join query per combination
+        c_ts.execute(SELECT_PLANS_SQL, (profile_id,))
+        plan_map = {(row[0], row[1]): (row[2], row[3], row[4]) for row in c_ts.fetchall()}
 
         data = []
 
         for row_ts in rows_ts:
             profile_id = row_ts[0]
+            raw_target_name = row_ts[1]
             target_name = row_ts[1].replace("\"", "'")
+            # effective priority: -1 when a priority-0 project's rule weights
+            # are all 0, computed by the query (yes, a magical number. too bad.)
             priority = row_ts[2]
 
-            # get the name of target without "panel" suffix
-            project_name_prefix=common.normalize_target_name(target_name)[0]
-
-            # if priority is 0 then check ruleweights
-            # if all are "0" then set priority to -1 (yes, a magical number. too bad.)
-            if priority == 0:
-                select_ruleweight = f"""select count(*)
-                                    from ruleweight
-                                    where weight > 0
-                                    and projectid in (select id from project where name like '{project_name_prefix}%')
-                                    ;"""
-                c_ts.execute(select_ruleweight)
-                row_ruleweight_count = c_ts.fetchall()
-                if row_ruleweight_count is not None and len(row_ruleweight_count) > 0 and row_ruleweight_count[0][0] == 0:
-                    # all rule weights are 0
-                    #print(f"{target_name}: all rule weights are 0: {row_ruleweight_count}")
-                    priority = -1
-
             datum = {
                 "profile_id": profile_id,
                 "target_name": target_name,
@@ -94,21 +119,8 @@ try:
 
             # initialize filters
             for filter_name in filter_names:
-                select_filter = f"""
-                            select et.defaultexposure, ep.desired, ep.accepted
-                            from exposureplan ep, exposuretemplate et, target t
-                            where et.profileid=ep.profileid
-                            and et.id=ep.exposureTemplateId
-                            and ep.exposure<0
-                            and et.name='{filter_name}'
-                            and et.profileid='{profile_id}'
-                            and ep.targetid=t.id
-                            and t.name=\"{target_name}\"
-                            ;"""
-                #print(select_filter)
-                c_ts.execute(select_filter)
-                row_filter = c_ts.fetchone()
-                if row_filter is not None and len(row_filter) > 0:
+                row_filter = plan_map.get((raw_target_name, filter_name))
+                if row_filter is not None:
                     exposure_s = row_filter[0]
                     desired_count = row_filter[1]
                     accepted_count = row_filter[2]
@@ -130,17 +142,55 @@ try:
         with open(filename_csv, "w") as f:
             f.write(data_csv)
 
-        # open the csv.. assume since we created it we want to edit
-        print(f"Opening CSV for profile '{profile_id}' / {profile_name}")
-        p = subprocess.Popen([r"C:\Program Files\LibreOffice\program\scalc.exe", filename_csv])
-        # wait for it to finish, can then chain import
-        p.wait()
+        return filename_csv, None
+    finally:
+        conn_ts.close()
+
 
-except sqlite3.Error as e:
-    if conn_ts is not None:
+if __name__ == "__main__":
+    try:
+        # one read-write connection up front to persist WAL mode and create any
+        # missing indexes, closed before the read-only workers start
+        conn_ts = sqlite3.connect(common.DATABASE_TARGET_SCHEDULER)
+        common.tune_connection(conn_ts)
+        common.ensure_scheduler_indexes(conn_ts)
         conn_ts.close()
-    if conn_ap is not None:
+
+        # output the following:
+        # profile id, profile name, target name, filter, desired hours, accepted hours, exposureplan id
+
+        # fetch profile data from the astrophotography database
+        conn_ap = sqlite3.connect(common.DATABASE_ASTROPHOTGRAPHY)
+        c_ap = conn_ap.cursor()
+        c_ap.execute("select id, name, filter_names from profile;")
+        rows_ap = c_ap.fetchall()
         conn_ap.close()
-    print(e)
-    traceback.print_exc()
+        if rows_ap is None or len(rows_ap) == 0:
+            print("ERROR no profiles found. Aborting.")
+            sys.exit(1)
+
+        rows_ap = [row_ap for row_ap in rows_ap if row_ap[0] not in SKIP_PROFILES]
+
+        # profiles read disjoint rows and write their own files, so export
+        # them in parallel with one worker process per core
+        with multiprocessing.Pool(processes=os.cpu_count()) as pool:
+            results = pool.map(export_profile, rows_ap)
+
+        written_csvs = [filename for filename, error in results if filename is not None]
+        errors = [error for filename, error in results if error is not None]
+
+        if errors:
+            for error in errors:
+                print(f"ERROR {error}")
+            sys.exit(1)
+
+        # optionally open the csvs.. assume since we created them we want to edit
+        if user_open and written_csvs:
+            print(f"Opening '{len(written_csvs)}' CSVs")
+            p = subprocess.Popen([r"C:\Program Files\LibreOffice\program\scalc.exe"] + written_csvs)
+            # wait for it to finish, can then chain import
+            p.wait()
 
+    except sqlite3.Error as e:
+        print(e)
+        traceback.print_exc()
@@ -3,6 +3,7 @@ This script imports CSV data into the NINA Scheduler database.
 It connects to both the astrophotography and scheduler databases for data synchronization.
 """
 
+import csv
 import os
 import sqlite3
 import sys
@@ -10,17 +11,62 @@ import traceback
 
 import common
 
+# one compile site per statement so sqlite reuses the compiled plan across rows
+RULEWEIGHT_SQL = "INSERT INTO ruleweight(name, weight, projectid) VALUES (?, ?, ?);"
+
+SELECT_PROJECT_SQL = """select p.id, t.id, p.priority
+                        from project p, target t
+                        where p.profileid=?
+                        and p.id=t.projectid
+                        and t.name=?
+                        and p.name like ?
+                        ;"""
+
+UPDATE_PROJECT_SQL = "update project set priority=? where id=?;"
+
+SELECT_EXPOSURETEMPLATE_SQL = """select et.id, et.defaultexposure
+                                from exposuretemplate et
+                                where et.profileid=?
+                                and et.name=?
+                                ;"""
+
+SELECT_EXPOSUREPLAN_SQL = """select ep.id, ep.desired, ep.exposure
+                            from exposureplan ep
+                            where ep.exposuretemplateid=?
+                            and ep.targetid=?
+                            and ep.exposure<0
+                            ;"""
+
+INSERT_EXPOSUREPLAN_SQL = """insert into exposureplan (profileid, exposure, desired, acquired, accepted, targetid, exposuretemplateid)
+                            values (?, -1, ?, '0', '0', ?,
+                                (
+                                    select et.id
+                                    from exposuretemplate et
+                                    where et.profileid=?
+                                    and et.name=?
+                                )
+                            );"""
+
+UPDATE_EXPOSUREPLAN_SQL = "update exposureplan set desired=? where id=?;"
+
 try:
-    conn_ts = sqlite3.connect(common.DATABASE_TARGET_SCHEDULER)
+    conn_ts = sqlite3.connect(common.DATABASE_TARGET_SCHEDULER, cached_statements=256)
+    common.tune_connection(conn_ts)
+    common.ensure_scheduler_indexes(conn_ts)
     initial_changes_ts = conn_ts.total_changes
     c_ts = conn_ts.cursor()
     c_ts.execute("PRAGMA case_sensitive_like=ON")
     conn_ap = sqlite3.connect(common.DATABASE_ASTROPHOTGRAPHY)
+    # no WAL here, the astrophotography db file is synced by Dropbox as-is
+    common.tune_connection(conn_ap, wal=False)
     c_ap = conn_ap.cursor()
     c_ap.execute("PRAGMA case_sensitive_like=ON")
 
     update_count = 0
 
+    # collect per-row errors and keep going, report them all at the end
+    errors = []
+
     # fetch profile data from the astrophotography database
     c_ap.execute("select id, name, filter_names from profile;")
     rows_ap = c_ap.fetchall()
@@ -42,27 +88,10 @@ try:
             # print(f"WARNING no CSV for profile {profile_id}")
             continue
 
-        with open(filename_csv, "r") as f:
-            # build lookup of header name to index
-            h = f.readline().split(",")
-            headers = {}
-            for i in range(0, len(h)):
-                headers[h[i].strip()] = i
-            
-            while True:
-                datum = {}
-                l = f.readline()
-                if not l:
-                    break
-
-                items = l.split(",")
-                
-                # build datum from headers & items
-                for k in headers.keys():
-                    i = headers[k]
-                    datum[k] = items[i].strip()
-                
-                data.append(datum)
+        # DictReader parses in C and handles quoted fields, unlike the old
+        # manual split(",") loop
+        with open(filename_csv, "r", newline="", buffering=65536) as f:
+            data = list(csv.DictReader(f))
         
         # all data for the profile is collected
         # walk through it and update exposure plans
@@ -73,20 +102,13 @@ try:
 
             for filter_name in filter_names:
                 # find project and target data
-                select_project = f"""select p.id, t.id, p.priority
-                                    from project p, target t
-                                    where p.profileid='{profile_id}'
-                                    and p.id=t.projectid
-                                    and t.name=\"{target_name}\"
-                                    and p.name like '%+%{filter_name}%'
-                                    ;"""
-                c_ts.execute(select_project)
+                c_ts.execute(SELECT_PROJECT_SQL, (profile_id, target_name, f"%+%{filter_name}%"))
                 row_project = c_ts.fetchall()
                 if row_project is None or len(row_project) != 1:
                     project_count = 0
                     if row_project is not None:
                         project_count = len(row_project)
-                    print(f"WARNING for target/filter '{target_name}/{filter_name}' found '{project_count}' projects, expected '1'. Skipping.\n{select_project}")
+                    print(f"WARNING for target/filter '{target_name}/{filter_name}' found '{project_count}' projects, expected '1'. Skipping.\n{SELECT_PROJECT_SQL}")
                     continue
 
                 project_id = row_project[0][0]
@@ -113,56 +135,39 @@ try:
                     new_priority = 0
 
                 # update the priority of the project
-                update_project = f"""update project
-                                    set priority='{new_priority}'
-                                    where id='{project_id}'
-                                    ;"""
-                c_ts.execute(update_project)
+                c_ts.execute(UPDATE_PROJECT_SQL, (new_priority, project_id))
 
-                conn_ts.commit()
-                
                 # upsert ruleweight so we can customize
-                c_ts.execute(f"DELETE FROM ruleweight WHERE projectid={project_id};")
-                c_ts.execute(f"INSERT INTO ruleweight(name, weight, projectid) VALUES ('Meridian Window Priority', {weight_meridian}, {project_id});")
-                c_ts.execute(f"INSERT INTO ruleweight(name, weight, projectid) VALUES ('Mosaic Completion', {weight_mosaic}, {project_id});")
-                c_ts.execute(f"INSERT INTO ruleweight(name, weight, projectid) VALUES ('Percent Complete', {weight_complete}, {project_id});")
-                c_ts.execute(f"INSERT INTO ruleweight(name, weight, projectid) VALUES ('Project Priority', {weight_priority}, {project_id});")
-                c_ts.execute(f"INSERT INTO ruleweight(name, weight, projectid) VALUES ('Setting Soonest', {weight_soonest}, {project_id});")
-                c_ts.execute(f"INSERT INTO ruleweight(name, weight, projectid) VALUES ('Target Switch Penalty', {weight_switch}, {project_id});")
-
-                conn_ts.commit()
-                
+                c_ts.execute("DELETE FROM ruleweight WHERE projectid=?;", (project_id,))
+                c_ts.executemany(RULEWEIGHT_SQL, [
+                    ('Meridian Window Priority', weight_meridian, project_id),
+                    ('Mosaic Completion', weight_mosaic, project_id),
+                    ('Percent Complete', weight_complete, project_id),
+                    ('Project Priority', weight_priority, project_id),
+                    ('Setting Soonest', weight_soonest, project_id),
+                    ('Target Switch Penalty', weight_switch, project_id),
+                ])
+
                 # find exposuretemplate (needed for multiple things so just fetch it)
-                select_exposuretemplate = f"""select et.id, et.defaultexposure
-                                            from exposuretemplate et
-                                            where et.profileid='{profile_id}'
-                                            and et.name='{filter_name}'
-                                            ;"""
-                c_ts.execute(select_exposuretemplate)
+                c_ts.execute(SELECT_EXPOSURETEMPLATE_SQL, (profile_id, filter_name))
                 row_et = c_ts.fetchall()
                 if row_et is None or len(row_et) != 1:
                     et_count = 0
                     if row_et is not None:
                         et_count = len(row_et)
-                    print(f"WARNING for target/filter '{target_name}/{filter_name}' found '{et_count}' exposuretemplates, expected '1'.  Skipping\n{select_exposuretemplate}")
+                    print(f"WARNING for target/filter '{target_name}/{filter_name}' found '{et_count}' exposuretemplates, expected '1'.  Skipping\n{SELECT_EXPOSURETEMPLATE_SQL}")
                     continue
 
                 exposuretemplate_id = row_et[0][0]
                 exposuretemplate_defaultexposure = row_et[0][1]
 
                 # find exposureplan
-                select_exposureplan = f"""select ep.id, ep.desired, ep.exposure
-                                        from exposureplan ep
-                                        where ep.exposuretemplateid='{exposuretemplate_id}'
-                                        and ep.targetid='{target_id}'
-                                        and ep.exposure<0
-                                        ;"""
-                c_ts.execute(select_exposureplan)
+                c_ts.execute(SELECT_EXPOSUREPLAN_SQL, (exposuretemplate_id, target_id))
                 row_ep = c_ts.fetchall()
                 if row_ep is not None and len(row_ep) > 1:
                     # it is OK if no row is found, but must be 0..1 rows
-                    print(f"ERROR found '{len(row_ep)}' exposureplans, expected '0' or '1'.\n{select_exposureplan}")
-                    sys.exit(1)
+                    errors.append(f"target/filter '{target_name}/{filter_name}' has '{len(row_ep)}' exposureplans, expected '0' or '1'")
+                    continue
                 
                 exposureplan_id = None
                 exposureplan_desired = 0
@@ -188,37 +193,29 @@ try:
                 # NOTE Use "-1" for exposure as it will then use the defaultexposure from exposuretemplate.
                 # TODO Add support for HDR where additional plans are created with different non-default exposure.
                 # TODO Consider adding unique constraint on exposuretemplate(profileid, filtername)!
-                update_exposureplan = ""
                 if row_ep is None or len(row_ep) == 0:
                      # insert, doesn't exist
-                    update_exposureplan = f"""insert into exposureplan (profileid, exposure, desired, acquired, accepted, targetid, exposuretemplateid)
-                                            values ('{profile_id}', -1, '{desired_count}', '0', '0', '{target_id}', 
-                                                (
-                                                    select et.id
-                                                    from exposuretemplate et
-                                                    where et.profileid='{profile_id}'
-                                                    and et.name='{filter_name}'
-                                                )
-                                            );"""
+                    c_ts.execute(INSERT_EXPOSUREPLAN_SQL, (profile_id, desired_count, target_id, profile_id, filter_name))
                 else:
                     # update, does exist
-                    update_exposureplan = f"""update exposureplan
-                                            set desired='{desired_count}'
-                                            where id='{exposureplan_id}'
-                                            ;"""
-
-                c_ts.execute(update_exposureplan)
-
-                conn_ts.commit()
+                    c_ts.execute(UPDATE_EXPOSUREPLAN_SQL, (desired_count, exposureplan_id))
 
                 update_count += 1
 
+        # commit once per profile; per-row commits forced an fsync for every update
+        conn_ts.commit()
+
         print(f"Updated '{update_count}' for {profile_name}")
 
     common.track_scheduler_changes(conn_ts, initial_changes_ts, False)
     conn_ts.commit()
     common.backup_scheduler_database()
 
+    if errors:
+        for error in errors:
+            print(f"ERROR {error}")
+        sys.exit(1)
+
 except sqlite3.Error as e:
     if conn_ts is not None:
         conn_ts.close()
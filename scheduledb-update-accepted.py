@@ -4,7 +4,6 @@ It uses command-line arguments to enable debugging and dry-run modes.
 """
 
 import argparse
-import re
 import sqlite3
 import traceback
 
@@ -20,13 +19,46 @@ args = vars(parser.parse_args())
 user_debug = args["debug"]
 user_dryrun = args["dryrun"]
 
+# separator for multi-panel target names, split with str.rpartition instead
+# of a regex match per row
+PANEL_SEP = " Panel "
+
+# one grouped query per profile replaces the two per-row queries on the
+# astrophotography database; sum and directories come back in the same pass
+SELECT_ACCEPTED_SQL = """select t.name, a.panel_name, f.name, a.shutter_time_seconds,
+                sum(a.accepted_count), group_concat(DISTINCT a.raw_directory)
+                from target t, accepted_data a, filter f, profile p
+                where a.target_id=t.id
+                and a.filter_id=f.id
+                and a.camera_id=p.camera_id
+                and a.optic_id=p.optic_id
+                and p.id=?
+                group by t.name, a.panel_name, f.name, a.shutter_time_seconds
+                ;"""
+
+# identical SQL text per call so sqlite3's statement cache reuses the
+# compiled plan instead of re-preparing per row
+UPDATE_EXPOSUREPLAN_SQL = "update exposureplan set accepted=?, acquired=? where id=?;"
+
+UPDATE_PROJECT_SQL = "update project set state=? where id=?;"
+
 
 # connect to the 2 databases
 try:
-    conn_ts = sqlite3.connect(common.DATABASE_TARGET_SCHEDULER)
+    # big statement cache keeps the hot loop statements compiled while
+    # one-shot queries come and go
+    conn_ts = sqlite3.connect(common.DATABASE_TARGET_SCHEDULER, cached_statements=256)
+    conn_ap = sqlite3.connect(common.DATABASE_ASTROPHOTGRAPHY, cached_statements=256)
+    # tuning flips the journal mode and index creation writes the schema,
+    # both persistent; a dry run must leave the databases untouched
+    if not user_dryrun:
+        common.tune_connection(conn_ts)
+        common.ensure_scheduler_indexes(conn_ts)
+        # no WAL here, the astrophotography db file is synced by Dropbox as-is
+        common.tune_connection(conn_ap, wal=False)
+        common.ensure_astrophotography_indexes(conn_ap)
     initial_changes_ts = conn_ts.total_changes
     c_ts = conn_ts.cursor()
-    conn_ap = sqlite3.connect(common.DATABASE_ASTROPHOTGRAPHY)
     c_ap = conn_ap.cursor()
 
     '''
@@ -45,9 +77,30 @@ try:
                     and t.projectid=p.id
                     ;""")
 
-    rows_ts = c_ts.fetchall()
-
-    for row_ts in rows_ts:
+    # stream rows off the iterating cursor instead of materializing the whole
+    # join up front; updates go through a second cursor so iteration state is
+    # not disturbed
+    c_ts_upd = conn_ts.cursor()
+
+    # profile id -> (accepted counts by (target, panel, filter, exposure),
+    #               raw directories by (target, panel)), loaded on first use
+    profile_cache = {}
+
+    # collect changed rows and flush them in batches so one cached statement
+    # and one transaction cover many rows instead of an execute per row
+    pending_accepted = []
+    pending_state = []
+    FLUSH_EVERY = 1000
+
+    def flush_pending():
+        if pending_accepted:
+            c_ts_upd.executemany(UPDATE_EXPOSUREPLAN_SQL, pending_accepted)
+            pending_accepted.clear()
+        if pending_state:
+            c_ts_upd.executemany(UPDATE_PROJECT_SQL, pending_state)
+            pending_state.clear()
+
+    for row_ts in c_ts:
         exposureplan_id = row_ts[0]
         profile = row_ts[1]
         targetname = row_ts[2]
@@ -64,52 +117,36 @@ try:
         if exposure > 0:
             exposure_duration_s = exposure
         # find panel name (if it exists)
-        m = re.match("(.*) Panel (.*)", targetname)
+        head, sep, tail = targetname.rpartition(PANEL_SEP)
         panelname = ""
-        if m is not None and m.groups() is not None and len(m.groups()) == 2:
-            targetname = m.groups()[0]
-            panelname = m.groups()[1]
+        if sep:
+            targetname = head
+            panelname = tail
+
+        # load all accepted data for the profile the first time we see it
+        if profile not in profile_cache:
+            accepted_map = {}
+            dirs_map = {}
+            c_ap.execute(SELECT_ACCEPTED_SQL, (profile,))
+            for row_ap in c_ap:
+                accepted_map[(row_ap[0], row_ap[1], row_ap[2], row_ap[3])] = row_ap[4]
+                if row_ap[5]:
+                    dirs_map.setdefault((row_ap[0], row_ap[1]), set()).update(row_ap[5].split(","))
+            profile_cache[profile] = (accepted_map, dirs_map)
+        accepted_map, dirs_map = profile_cache[profile]
 
         # figure out the status from the location of the accepted data, using the HIGHEST value in case there are multiple found
         # NOTE on multiples found, common if data doesn't have master calibration frames yet and is split across multiple dirs
-        select_status=f"""select distinct a.raw_directory
-                        from target t, accepted_data a, profile p
-                        where a.target_id=t.id
-                        and a.camera_id=p.camera_id
-                        and a.optic_id=p.optic_id
-                        and p.id='{profile}'
-                        and t.name=\"{targetname}\"
-                        and a.panel_name=\"{panelname}\"
-                        ;"""
-        c_ap.execute(select_status)
-        rows_dir=c_ap.fetchall()
+        dirs = dirs_map.get((targetname, panelname))
         new_project_state=project_state
-        if rows_dir is not None and len(rows_dir) > 0:
+        if dirs:
             new_project_state=-1
-            for dir in rows_dir:
-                new_project_state = max(new_project_state, common.project_status_from_path(dir[0]))
-
-        # find the count from the ap database
-        select_accepted=f"""select sum(a.accepted_count)
-                        from target t, accepted_data a, filter f, profile p
-                        where a.target_id=t.id
-                        and a.filter_id=f.id
-                        and a.camera_id=p.camera_id
-                        and a.optic_id=p.optic_id
-                        and p.id='{profile}'
-                        and t.name=\"{targetname}\"
-                        and a.panel_name=\"{panelname}\"
-                        and f.name='{filtername}'
-                        and a.shutter_time_seconds='{exposure_duration_s}'
-                        ;
-                     """
-        c_ap.execute(select_accepted)
-
-        rows_ap = c_ap.fetchall()
-        # handle if no rows were returned by setting accepted = 0
-        new_accepted_count = 0
-        for row_ap in rows_ap:
-            new_accepted_count = row_ap[0]
+            for dir in dirs:
+                new_project_state = max(new_project_state, common.project_status_from_path(dir))
+
+        # find the count from the cached profile data
+        # handle if no row was found by setting accepted = 0
+        new_accepted_count = accepted_map.get((targetname, panelname, filtername, exposure_duration_s))
         if new_accepted_count is None:
             new_accepted_count = 0
 
@@ -126,22 +163,18 @@ try:
         if new_accepted_count != old_accepted_count:
             print(f"update accepted count: {targetname}, panel={panelname}, filter={filtername}: {old_accepted_count} --> {new_accepted_count}")
             if not user_dryrun:
-                c_ts.execute(f"""update exposureplan
-                                set accepted={new_accepted_count},
-                                acquired={new_accepted_count}
-                                where id={exposureplan_id};
-                            """)
+                pending_accepted.append((new_accepted_count, new_accepted_count, exposureplan_id))
 
         # did the project state change?
         if new_project_state != project_state:
             print(f"update project state: {project_name}/{targetname}: {project_state} --> {new_project_state}")
             if not user_dryrun:
-                c_ts.execute(f"""update project
-                                set state='{new_project_state}'
-                                where id='{project_id}'
-                                ;""")
+                pending_state.append((new_project_state, project_id))
+
+        if len(pending_accepted) >= FLUSH_EVERY or len(pending_state) >= FLUSH_EVERY:
+            flush_pending()
 
-        conn_ts.commit()
+    flush_pending()
 
     common.track_scheduler_changes(conn_ts, initial_changes_ts, user_dryrun)
     conn_ts.commit()
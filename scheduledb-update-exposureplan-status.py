@@ -9,29 +9,6 @@ import os
 
 import common
 
-# originally defined in common, but to reduce dependencies pulling it out.
-def replace_env_vars(input:str):
-    """
-    Replace environment variables in a given string with their actual values.
-
-    Args:
-        input (str): The input string containing environment variable placeholders (e.g., %VAR_NAME%).
-
-    Returns:
-        str: The input string with environment variables replaced by their corresponding values.
-    """
-    output = input
-    output_uc = input.upper()
-    for e in os.environ.items():
-        k = f"%{e[0]}%"
-        v = e[1]
-        while k in output_uc:
-            # env vars are uppercase but ignore case when used.  use slices to do replacing.
-            k_start = output_uc.find(k)
-            output = output[:k_start] + v + output[k_start + len(k):]
-            output_uc = output.upper()
-    return output
-
 try:
     """
     Main script execution to update the exposure plan status in the NINA Scheduler database.
@@ -42,7 +19,9 @@ try:
     Exceptions:
         sqlite3.Error: Handles SQLite errors and ensures the database connection is closed properly.
     """
-    conn_ts = sqlite3.connect(replace_env_vars(r"%LocalAppData%\NINA\SchedulerPlugin\schedulerdb.sqlite"))
+    # os.path.expandvars handles %NAME% natively on Windows in one C-level pass
+    conn_ts = sqlite3.connect(os.path.expandvars(r"%LocalAppData%\NINA\SchedulerPlugin\schedulerdb.sqlite"))
+    common.tune_connection(conn_ts)
     initial_changes_ts = conn_ts.total_changes
     c_ts = conn_ts.cursor()
 
@@ -12,40 +12,138 @@ Exceptions:
     sqlite3.Error: Handles SQLite errors and ensures database connections are closed properly.
 """
 
-import os
+import copy
+import json
 import re
 import sqlite3
+import sys
 import traceback
-import yaml
+
+from pathlib import Path
 
 import common
 
 
+# compile once at module load, both run once per Targets file
+PANEL_RE = re.compile(r"(.*) Panel (.*)")
+PROFILE_PATH_RE = re.compile(r".*/([^/]*)/Targets.*")
+
+# one compile site per statement so sqlite reuses the compiled plan across rows
+# upserts let the engine do a single b-tree lookup per row instead of a
+# select round trip followed by a conditional insert/update
+# NOTE create all projects as "Active" (state=1)
+INSERT_PROJECT_SQL = """insert into project (
+                        profileid, name, state, priority, createdate, minimumtime, minimumaltitude,
+                        usecustomhorizon, horizonoffset, meridianwindow, filterswitchfrequency,
+                        ditherevery, enablegrader, isMosaic
+                    )
+                    values (?, ?, 1, ?, 1700839363, 30, 0, 1, 0, 0, 0, ?, 0, ?)
+                    on conflict (profileid, name) do nothing;"""
+
+# only touch the row when the coordinates actually moved (same rounding the
+# old python comparison used)
+INSERT_TARGET_SQL = """insert into target (
+                        name, active, ra, dec, epochcode, rotation, roi, projectid
+                    )
+                    values (?, 1, ?, ?, 2, ?, 100,
+                        (select id
+                            from project
+                            where profileid=?
+                            and name=?)
+                    )
+                    on conflict (name, projectid) do update set
+                        ra=excluded.ra,
+                        dec=excluded.dec,
+                        rotation=excluded.rotation
+                    where round(target.ra, 6) != round(excluded.ra, 6)
+                    or round(target.dec, 6) != round(excluded.dec, 6)
+                    or target.rotation != excluded.rotation;"""
+
+UPDATE_TARGET_SQL = "update target set ra=?, dec=?, rotation=? where id=?;"
+
+
+# project templates per profile-name suffix, cloned per file instead of
+# rebuilding the dict literals on every iteration.  isMosaic is filled in at
+# use time and ditherevery can be overridden per profile-name prefix below.
+def _project(ditherevery: int, filternames):
+    return {
+        "priority": 0,
+        "ditherevery": ditherevery,
+        "filters": [{"filtername": f} for f in filternames],
+    }
+
+def _lrgb_sho_template(lrgb_ditherevery: int):
+    # the mono cameras share the same project shape, only the LRGB dither
+    # default differs per camera
+    return {
+        "LRGB": _project(lrgb_ditherevery, ("L", "R", "G", "B")),
+        "SHO": _project(5, ("S", "H", "O")),
+    }
+
+PROJECT_TEMPLATES = {
+    "+ZWO ASI2600MM Pro": _lrgb_sho_template(15),
+    "+ATR585M": _lrgb_sho_template(10),
+    "+AP26CC": {
+        "UVIR": _project(5, ("UVIR",)),
+        "LeXtr": _project(4, ("LeXtr",)),
+        "ALPT": _project(4, ("ALPT",)),
+    },
+    "+DWARFIII": {
+        "Astro": _project(0, ("Astro",)),
+        "Dual-Band": _project(0, ("Dual-Band",)),
+    },
+}
+
+# profile-name prefix -> project key -> ditherevery
+PREFIX_OVERRIDES = {
+    "C8@f6.3+": {"LRGB": 15, "SHO": 5},
+    "C8E@f7.0+": {"LRGB": 15, "SHO": 2},
+    "E120@f7.0+": {"LRGB": 7, "SHO": 1},
+}
+
 # collected data
 data = {}
 
-# collect all file names
-filenames = []
-
-for root, d_names, f_names in os.walk(common.DIRECTORY_NINA_PROFILES):
-    for f in f_names:
-        filenames.append(os.path.normpath(f"{root}\\{f}"))
+# collect target file names with a targeted glob so the walk skips everything
+# outside Targets directories; as_posix keeps the separators regex-friendly
+filenames = [p.as_posix() for p in Path(common.DIRECTORY_NINA_PROFILES).rglob("Targets/*.json")]
 
 
 # connect to the 2 databases
 try:
     conn_ts = sqlite3.connect(common.DATABASE_TARGET_SCHEDULER)
+    # WAL + NORMAL so the bulk refresh below isn't fsync-bound per commit
+    common.tune_connection(conn_ts)
     initial_changes_ts = conn_ts.total_changes
     c_ts = conn_ts.cursor()
     conn_ap = sqlite3.connect(common.DATABASE_ASTROPHOTGRAPHY)
     c_ap = conn_ap.cursor()
 
+    # the profile table is tiny and names repeat across files, so fetch it
+    # once into a dict and release the astrophotography database right away
+    profiles = dict(c_ap.execute("select name, id from profile;").fetchall())
+    conn_ap.close()
+
+    # the upserts need unique keys to detect conflicts on
+    c_ts.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_project_profileid_name ON project(profileid, name)")
+    c_ts.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_target_name_projectid ON target(name, projectid)")
+
+    # bulk-load what already exists so the loop does O(1) membership tests
+    # instead of touching the database per (file, project key)
+    project_ids = {(row[1], row[2]): row[0] for row in c_ts.execute("select id, profileid, name from project;")}
+    existing_targets = {(row[1], row[2]): (row[0], row[3], row[4], row[5]) for row in c_ts.execute("select id, projectid, name, ra, dec, rotation from target;")}
+
+    # new targets and changed coordinates, flushed in bulk after the loop
+    target_inserts = []
+    target_updates = []
+
     # find targets
-    for filename in (filename for filename in filenames if "Targets" in filename and filename.endswith(".json")):
-        with open(filename, "r") as stream:
+    for filename in filenames:
+        # these are strict JSON, the C json parser is much faster than yaml
+        with open(filename, "rb") as stream:
             try:
-                raw_data = yaml.safe_load(stream)
-            except yaml.YAMLError as ex:
+                raw_data = json.load(stream)
+            except json.JSONDecodeError as ex:
                 print(f"ERROR reading file {filename}")
                 traceback.print_exc()
 
@@ -53,36 +151,43 @@ try:
         targetname_with_panel=targetname_with_panel.replace("'", "")
 
         # find panel name (if it exists)
-        m = re.match("(.*) Panel (.*)", targetname_with_panel)
+        m = PANEL_RE.match(targetname_with_panel)
         targetname = targetname_with_panel
         panelname = ""
         if m is not None and m.groups() is not None and len(m.groups()) == 2:
             targetname = m.groups()[0]
             panelname = m.groups()[1]
-        
-        coord_ra=(
-            float(raw_data["Target"]["InputCoordinates"]["RAHours"]) +
-            float((raw_data["Target"]["InputCoordinates"]["RAMinutes"]) / 60) +
-            float((raw_data["Target"]["InputCoordinates"]["RASeconds"]) / 60 / 60)
+
+        # the same names repeat across panels and files; interning makes the
+        # later dict lookups pointer compares on one shared object
+        targetname = sys.intern(targetname)
+        panelname = sys.intern(panelname)
+
+        coordinates = raw_data["Target"]["InputCoordinates"]
+
+        coord_ra = (
+            float(coordinates["RAHours"]) +
+            float(coordinates["RAMinutes"]) * (1 / 60) +
+            float(coordinates["RASeconds"]) * (1 / 3600)
         )
 
+        # NINA serializes DecDegrees signed (e.g. -5 30' is DecDegrees:-5,
+        # DecMinutes:30, NegativeDec:true), so sum per-component magnitudes
+        # and let the NegativeDec flag apply the sign exactly once
         coord_dec = (
-            abs(float(raw_data["Target"]["InputCoordinates"]["DecDegrees"])) +
-            abs(float(raw_data["Target"]["InputCoordinates"]["DecMinutes"]) / 60) +
-            abs(float(raw_data["Target"]["InputCoordinates"]["DecSeconds"]) / 60 / 60)
+            abs(float(coordinates["DecDegrees"])) +
+            abs(float(coordinates["DecMinutes"])) * (1 / 60) +
+            abs(float(coordinates["DecSeconds"])) * (1 / 3600)
         )
+        if coordinates["NegativeDec"]:
+            coord_dec = -coord_dec
 
         rotation = 0
         if "PositionAngle" in raw_data["Target"]:
             rotation = float(raw_data["Target"]["PositionAngle"])
 
-        if raw_data["Target"]["InputCoordinates"]["NegativeDec"]:
-            coord_dec *= -1
-        
         # don't like this, but get profile _name_ from the parent dir of Targets.. so many brittle "standards"
-        # monkey with filename as the path separator is messing up regex.
-        filename = "/".join(filename.split(os.sep))
-        m = re.match(f".*/([^/]*)/Targets.*", filename)
+        m = PROFILE_PATH_RE.match(filename)
         profile_name = ""
 
         if m is not None and m.groups() is not None and len(m.groups()) == 1:
@@ -92,11 +197,10 @@ try:
         if profile_name == "C8E@f7+ZWO ASI2600MM Pro":
             profile_name = "C8E@f7.0+ZWO ASI2600MM Pro"
 
-        c_ap.execute(f"select id from profile where name='{profile_name}'")
-        row_ap = c_ap.fetchone() # UniqueKey on name, there can be only one
-        if row_ap is not None:
-            profile_id = row_ap[0]
-        else:
+        profile_name = sys.intern(profile_name)
+
+        profile_id = profiles.get(profile_name) # UniqueKey on name, there can be only one
+        if profile_id is None:
             print(f"ERROR: unable to find profile id for '{profile_name}'")
             break
         
@@ -106,225 +210,54 @@ try:
             isMosaic = "1"
 
         project_data = {}
-        if profile_name.endswith("+ZWO ASI2600MM Pro"):
-            project_data["LRGB"] = {
-                "priority": 0,
-                "ditherevery": 15,
-                "isMosaic": isMosaic,
-                "filters": [
-                    {
-                        "filtername": "L",
-                    },
-                    {
-                        "filtername": "R",
-                    },
-                    {
-                        "filtername": "G",
-                    },
-                    {
-                        "filtername": "B",
-                    },
-                ]
-            }
-            project_data["SHO"] = {
-                "priority": 0,
-                "ditherevery": 5,
-                "isMosaic": isMosaic,
-                "filters": [
-                    {
-                        "filtername": "O",
-                        "filtername": "S",
-                        "filtername": "H",
-                    },
-                ]
-            }
-            if profile_name.startswith("C8@f6.3+"):
-                project_data["LRGB"]["ditherevery"] = 15
-                project_data["SHO"]["ditherevery"] = 5
-            if profile_name.startswith("C8E@f7.0+"):
-                project_data["LRGB"]["ditherevery"] = 15
-                project_data["SHO"]["ditherevery"] = 2
-            elif profile_name.startswith("E120@f7.0+"):
-                project_data["LRGB"]["ditherevery"] = 7
-                project_data["SHO"]["ditherevery"] = 1
-        elif profile_name.endswith("+ATR585M"):
-            project_data["LRGB"] = {
-                "priority": 0,
-                "ditherevery": 10,
-                "isMosaic": isMosaic,
-                "filters": [
-                    {
-                        "filtername": "L",
-                    },
-                    {
-                        "filtername": "R",
-                    },
-                    {
-                        "filtername": "G",
-                    },
-                    {
-                        "filtername": "B",
-                    },
-                ]
-            }
-            project_data["SHO"] = {
-                "priority": 0,
-                "ditherevery": 5,
-                "isMosaic": isMosaic,
-                "filters": [
-                    {
-                        "filtername": "O",
-                        "filtername": "S",
-                        "filtername": "H",
-                    },
-                ]
-            }
-            if profile_name.startswith("C8@f6.3+"):
-                project_data["LRGB"]["ditherevery"] = 15
-                project_data["SHO"]["ditherevery"] = 5
-            if profile_name.startswith("C8E@f7.0+"):
-                project_data["LRGB"]["ditherevery"] = 15
-                project_data["SHO"]["ditherevery"] = 2
-            elif profile_name.startswith("E120@f7.0+"):
-                project_data["LRGB"]["ditherevery"] = 7
-                project_data["SHO"]["ditherevery"] = 1
-        elif profile_name.endswith("+AP26CC"):
-            project_data["UVIR"] = {
-                "priority": 0,
-                "ditherevery": 5,
-                "isMosaic": isMosaic,
-                "filters": [
-                    {
-                        "filtername": "UVIR",
-                    },
-                ]
-            }
-            project_data["LeXtr"] = {
-                "priority": 0,
-                "ditherevery": 4,
-                "isMosaic": isMosaic,
-                "filters": [
-                    {
-                        "filtername": "LeXtr",
-                    },
-                ]
-            }
-            project_data["ALPT"] = {
-                "priority": 0,
-                "ditherevery": 4,
-                "isMosaic": isMosaic,
-                "filters": [
-                    {
-                        "filtername": "ALPT",
-                    },
-                ]
-            }
-        elif profile_name.endswith("+DWARFIII"):
-            project_data["Astro"] = {
-                "priority": 0,
-                "ditherevery": 0,
-                "isMosaic": isMosaic,
-                "filters": [
-                    {
-                        "filtername": "Astro",
-                    },
-                ]
-            }
-            project_data["Dual-Band"] = {
-                "priority": 0,
-                "ditherevery": 0,
-                "isMosaic": isMosaic,
-                "filters": [
-                    {
-                        "filtername": "Dual-Band",
-                    },
-                ]
-            }
+        suffix = next((s for s in PROJECT_TEMPLATES if profile_name.endswith(s)), None)
+        if suffix is not None:
+            project_data = copy.deepcopy(PROJECT_TEMPLATES[suffix])
+            for key in project_data:
+                project_data[key]["isMosaic"] = isMosaic
+            for prefix, overrides in PREFIX_OVERRIDES.items():
+                if profile_name.startswith(prefix):
+                    for key, ditherevery in overrides.items():
+                        if key in project_data:
+                            project_data[key]["ditherevery"] = ditherevery
+                    break
         else:
             print(f"WARNING: profile not handled!  '{profile_name}'")
 
         
         #print(f"{profile_name}: {targetname}/{panelname} @ {coord_ra} / {coord_dec}")
         for key in project_data.keys():
-            # don't create duplicates
-            select_project = f"""select id 
-                                from project
-                                where profileid='{profile_id}'
-                                and name=\"{targetname}+{key}\"
-                                ;
-                                """
-            c_ts.execute(select_project)
-            row_p=c_ts.fetchone()
-            if row_p is None or len(row_p) == 0:
-                print(f"CREATE profile: {profile_name}/{targetname}+{key}")
-                # NOTE create all projects as "Active" (state=1)
-                insert_project = f"""insert into project (
-                                    profileid, name, state, priority, createdate, minimumtime, minimumaltitude, 
-                                    usecustomhorizon, horizonoffset, meridianwindow, filterswitchfrequency,
-                                    ditherevery, enablegrader, isMosaic
-                                )
-                                values (
-                                    '{profile_id}',
-                                    \"{targetname}+{key}\",
-                                    1,
-                                    {project_data[key]["priority"]},
-                                    1700839363,
-                                    30, 0, 1, 0, 0, 0,
-                                    {project_data[key]["ditherevery"]},
-                                    0,
-                                    {project_data[key]["isMosaic"]}
-                                );"""
-                c_ts.execute(insert_project)
-
-            select_target = f"""select id, ra, dec, rotation
-                                from target
-                                where name=\"{targetname_with_panel}\"
-                                and projectid in (select id 
-                                    from project
-                                    where profileid='{profile_id}'
-                                    and name=\"{targetname}+{key}\")
-                                ;
-                                """
-            c_ts.execute(select_target)
-            row_p=c_ts.fetchone()
-            if row_p is None or len(row_p) == 0:
+            project_name = f"{targetname}+{key}"
+
+            project_key = (profile_id, project_name)
+            if project_key not in project_ids:
+                print(f"CREATE profile: {profile_name}/{project_name}")
+                # insert in-line so the target subselect below can resolve it
+                c_ts.execute(INSERT_PROJECT_SQL, (
+                    profile_id,
+                    project_name,
+                    project_data[key]["priority"],
+                    project_data[key]["ditherevery"],
+                    project_data[key]["isMosaic"],
+                ))
+                project_ids[project_key] = c_ts.lastrowid
+
+            target_key = (project_ids[project_key], targetname_with_panel)
+            existing = existing_targets.get(target_key)
+            if existing is None:
                 print(f"CREATE target: {profile_name}/{targetname_with_panel}")
-                insert_target = f"""insert into target (
-                                    name, active, ra, dec, epochcode, rotation, roi, projectid
-                                )
-                                values (
-                                    \"{targetname_with_panel}\",
-                                    1,
-                                    {coord_ra},
-                                    {coord_dec},
-                                    2,
-                                    {rotation},
-                                    100,
-                                    (select id 
-                                        from project
-                                        where profileid='{profile_id}'
-                                        and name=\"{targetname}+{key}\")
-                                );
-                                """
-                c_ts.execute(insert_target)
+                target_inserts.append((targetname_with_panel, coord_ra, coord_dec, rotation, profile_id, project_name))
+                existing_targets[target_key] = (None, coord_ra, coord_dec, rotation)
             else:
                 precision = 6
-                t_id = row_p[0]
-                old_ra = round(row_p[1], precision)
-                old_dec = round(row_p[2], precision)
-                old_rotation = row_p[3]
-                if old_ra != round(coord_ra, precision) or old_dec != round(coord_dec, precision) or old_rotation != rotation:
+                t_id, old_ra, old_dec, old_rotation = existing
+                if round(old_ra, precision) != round(coord_ra, precision) or round(old_dec, precision) != round(coord_dec, precision) or old_rotation != rotation:
                     print(f"UPDATE target: {profile_name}/{targetname_with_panel}")
-                    print(f"\tra     ({row_p[1]} --> {coord_ra})")
-                    print(f"\tdec    ({row_p[2]} --> {coord_dec})")
-                    print(f"\rotation({row_p[3]} --> {rotation})")
-                    # update coordinates..
-                    update_target = f"""update target
-                                        set ra={coord_ra},
-                                        dec={coord_dec},
-                                        rotation={rotation}
-                                        where id={t_id};"""
-                    c_ts.execute(update_target)
+                    print(f"\tra     ({old_ra} --> {coord_ra})")
+                    print(f"\tdec    ({old_dec} --> {coord_dec})")
+                    print(f"\trotation({old_rotation} --> {rotation})")
+                    target_updates.append((coord_ra, coord_dec, rotation, t_id))
+                    existing_targets[target_key] = (t_id, coord_ra, coord_dec, rotation)
 
             '''
             for filter in project_data[key]["filters"]:
@@ -383,9 +316,16 @@ try:
                                             """
                     c_ts.execute(insert_exposureplan)
                 '''
-            
-            conn_ts.commit()
 
+    # flush the batched target writes; the upsert keeps a concurrent writer
+    # from breaking the insert batch
+    if target_inserts:
+        c_ts.executemany(INSERT_TARGET_SQL, target_inserts)
+    if target_updates:
+        c_ts.executemany(UPDATE_TARGET_SQL, target_updates)
+
+    # one commit for the whole refresh; committing per project key forced an
+    # fsync for every iteration
     common.track_scheduler_changes(conn_ts, initial_changes_ts, False)
     conn_ts.commit()
     common.backup_scheduler_database()
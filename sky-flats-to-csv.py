@@ -12,73 +12,77 @@ Command-line Arguments:
 """
 
 import argparse
+import csv
 import os
 
 import common
 import filesystem
 
-parser = argparse.ArgumentParser(description="output data about sky flats to csv for analysis")
-parser.add_argument("--input_dir", type=str, help="directory to search for images", default=common.DIRECTORY_ROOT_RAW_FLAT)
-parser.add_argument("--output_csv", type=str, help="csv file to output results", default=common.DIRECTORY_ROOT_RAW_FLAT+os.path.sep+"sky-flats-analysis.csv")
-parser.add_argument("--debug", action='store_true')
-parser.add_argument("--dryrun", action='store_true')
+# subset of attributes to keep, making the data easier to work with; one
+# shared tuple instead of a fresh list per row
+KEEP_KEYS = (
+    "filter",
+    "camera",
+    "optic",
+    "focal_ratio",
+    "date-loc",
+    "sunangle",
+    "centalt",
+    "exposureseconds",
+    "gain",
+    "offset",
+    "moonangl",
+    "settemp",
+    "temp",
+    "ra",
+    "dec",
+    "filename",
+)
 
-# treat args parsed as a dictionary
-args = vars(parser.parse_args())
+def main(input_dir: str, output_csv: str, debug=False, dryrun=False):
+    """
+    Collect sky flat metadata from input_dir and write the analysis CSV.
 
-user_input_dir = args["input_dir"]
-user_output_csv = args["output_csv"]
-user_debug = args["debug"]
-user_dryrun = args["dryrun"]
+    Callable so other scripts can reuse the export instead of copying it;
+    the CLI below is a thin wrapper around this.
+    """
+    print(f"Reading data for sky flats...")
 
+    data_flats = common.get_filtered_metadata(
+        dirs=[input_dir],
+        patterns=[r".*\.fits$"],
+        recursive=True,
+        filters={"type": "FLAT"},
+        profileFromPath=True,
+        workers=os.cpu_count(),
+    )
 
-print(f"Reading data for sky flats...")
+    if debug:
+        print(data_flats)
 
-data_flats = common.get_filtered_metadata(
-    dirs=[user_input_dir],
-    patterns=[r".*\.fits$"],
-    recursive=True,
-    filters={"type": "FLAT"},
-    profileFromPath=True,
-)
+    if dryrun:
+        print(f"DRYRUN: would write '{len(data_flats)}' rows to {output_csv}")
+        return
 
-if user_debug:
-    print(data_flats)
+    print(f"Writing CSV for sky flats...")
+    # stream each row straight to the file instead of flattening everything into
+    # a list and one big csv string first; the key is dropped since it's already
+    # in the 'filename' attribute
+    with open(output_csv, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=KEEP_KEYS)
+        writer.writeheader()
+        for datum in data_flats.values():
+            writer.writerow({k: datum[k] for k in KEEP_KEYS})
 
-# convert data to array, drop key since it's already in the 'filename' attribute
-data_flattened = []  # yes, I get this is a bit ironic and possibly confusing. I like it, move along.
-for key in data_flats:
-    datum = data_flats[key]
-    # keep a subset of attributes to make the data easier to work with
-    keep_keys = [
-        "filter",
-        "camera",
-        "optic",
-        "focal_ratio",
-        "date-loc",
-        "sunangle",
-        "centalt",
-        "exposureseconds",
-        "gain",
-        "offset",
-        "moonangl",
-        "settemp",
-        "temp",
-        "ra",
-        "dec",
-        "filename",
-    ]
-    datum_filtered = {}
-    for k in keep_keys:
-        datum_filtered[k] = datum[k]
-    data_flattened.append(datum_filtered)
 
-if user_debug:
-    print(data_flattened)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="output data about sky flats to csv for analysis")
+    parser.add_argument("--input_dir", type=str, help="directory to search for images", default=common.DIRECTORY_ROOT_RAW_FLAT)
+    parser.add_argument("--output_csv", type=str, help="csv file to output results", default=common.DIRECTORY_ROOT_RAW_FLAT+os.path.sep+"sky-flats-analysis.csv")
+    parser.add_argument("--debug", action='store_true')
+    parser.add_argument("--dryrun", action='store_true')
 
+    # treat args parsed as a dictionary
+    args = vars(parser.parse_args())
 
-print(f"Writing CSV for sky flats...")
-filename_csv = user_output_csv
-data_csv = common.simpleObject_to_csv(data_flattened, output_headers=True)
-with open(filename_csv, "w") as f:
-    f.write(data_csv)
+    main(args["input_dir"], args["output_csv"], debug=args["debug"], dryrun=args["dryrun"])
@@ -4,15 +4,49 @@ It includes classes and methods to process directories and databases for generat
 """
 
 import argparse
+import csv
 import json
+import logging
 import os
+import sys
 import traceback
+
+from concurrent.futures import ThreadPoolExecutor
+
 import common
 import database
 
 FILENAME_CSV="astrobin_csv.txt"
 FILENAME_TOTALS="totals.txt"
 
+# column order of the Astrobin csv output
+ASTROBIN_FIELDS = ("date", "filter", "number", "duration", "fNumber", "bortle")
+
+logger = logging.getLogger(__name__)
+
+# stable statement text with a bound parameter so sqlite reuses the cached
+# plan and no quote escaping of the directory is needed
+# only columns consumed downstream are selected; optic/camera ids are implied
+# by the profile (unique on optic_id,camera_id) so they are not fetched
+# NOTE the columns are named because of what Astrobin wants!
+SELECT_DATA_SQL = """
+    select t.id, t.name, a.panel_name,
+        substr(a.raw_directory, 1, instr(a.raw_directory, ?) - 2),
+        a.date, f.name, f.astrobin_id, a.accepted_count, a.shutter_time_seconds, o.focal_ratio, l.bortle, p.id
+    from target t, accepted_data a, filter f, optic o, location l, camera c, profile p
+    where t.id=a.target_id
+    and f.id=a.filter_id
+    and o.id=a.optic_id
+    and l.id=a.location_id
+    and c.id=a.camera_id
+    and p.optic_id=o.id
+    and p.camera_id=c.id
+    and a.raw_directory like ?
+    order by p.id, f.name, a.raw_directory, a.panel_name, f.astrobin_id
+    ;"""
+
+SELECT_DATA_COLUMNS = ['target_id', 'targetname', 'panelname', 'target_directory', 'date', 'filter_name', 'filter_astrobinid', 'accepted_count', 'exposureseconds', 'focal_ratio', 'bortle', 'profile_id']
+
 class SummaryData():
     from_dir = None
     db_ap:database.Astrophotgraphy = None
@@ -33,136 +67,126 @@ class SummaryData():
         self.from_dir = from_dir
         self.debug = debug
         self.dryrun = dryrun
+        self._grouped_data = None
 
     def prepare_data(self) -> dict[str, str]:
         """
         Prepare summary data by querying the database and organizing it by target directory.
+        The result is cached, so repeated calls only query the database once.
 
         Returns:
             dict: A dictionary where the key is the target directory and the value is a list of key-value pairs.
         """
 
+        if self._grouped_data is not None:
+            return self._grouped_data
+
         output = {}
 
+        # only close the connection if this call opened it; a caller-managed
+        # connection (e.g. the context manager in __main__) stays open and
+        # keeps its page cache warm across passes
+        opened_here = not self.db_ap.isOpen()
+
         try:
-            self.db_ap.open()
+            if opened_here:
+                self.db_ap.open()
 
             # for every target (unique per optic/camera!), build csv data and write to target's root directory (parent of 'accept')
-            d = self.from_dir.replace("'", "''")
-            stmt=f"""
-                select o.id, c.id, t.id, t.name, a.panel_name, a.raw_directory, a.date, f.name, f.astrobin_id, a.accepted_count, a.shutter_time_seconds, o.focal_ratio, l.bortle, p.id
-                from target t, accepted_data a, filter f, optic o, location l, camera c, profile p
-                where t.id=a.target_id
-                and f.id=a.filter_id
-                and o.id=a.optic_id
-                and l.id=a.location_id
-                and c.id=a.camera_id
-                and p.optic_id=o.id
-                and p.camera_id=c.id
-                and a.raw_directory like '{d}%'
-                order by p.id, f.name, a.raw_directory, a.panel_name, f.astrobin_id
-                ;"""
-            data = self.db_ap.select(
-                stmt=stmt,
-                columns=['optic_id', 'camera_id', 'target_id', 'targetname', 'panelname', 'raw_directory', 'date', 'filter_name', 'filter_astrobinid', 'accepted_count', 'exposureseconds', 'focal_ratio', 'bortle', 'profile_id'],
-            )
-            # NOTE the columns are named because of what Astrobin wants!
-
-            # create a dict representing the last target that contains
-            last_key:str=None
-            last_raw_directory:str=None
-
-            for datum in data:
-                this_key = f"{datum['profile_id']}+{datum['optic_id']}+{datum['camera_id']}+{datum['target_id']}+{datum['panelname']}"
-                if last_key is None or this_key != last_key:
-                    # new target
-                    last_key = this_key
-                    # base dir is everything up to but excluding "accept"
-                    accept_start = datum['raw_directory'].find(common.DIRECTORY_ACCEPT)
-                    #if last_raw_directory and self.debug:
-                    #    print(f"len(output[this_raw_directory])={len(output[this_raw_directory])}")
-                    #    print(f"output[this_raw_directory]={output[this_raw_directory]}")
-                    last_raw_directory = datum['raw_directory'][:accept_start-1]
-                    if self.debug:
-                        print(f"last_key={last_key}")
-                        print(f"last_raw_directory={last_raw_directory}")
-
-                accept_start = datum['raw_directory'].find(common.DIRECTORY_ACCEPT)
-                this_raw_directory = datum['raw_directory'][:accept_start-1]
-                #if self.debug:
-                #    print(f"this_raw_directory={this_raw_directory}")
-
-                if last_raw_directory != this_raw_directory:
-                    print(f"WARNING last_raw_directory={last_raw_directory}")
-                    print(f"WARNING this_raw_directory={this_raw_directory}")
-                    print(f"WARNING multiple directories for '{datum['targetname']}'")
-
-                if this_raw_directory not in output:
-                    output[this_raw_directory] = []
-                output[this_raw_directory].append(datum)
-        except Exception as e:
-            print(e)
-            traceback.print_exc()
+            # the base dir (everything up to but excluding 'accept') is computed
+            # by the query instead of two string searches per row here; rows
+            # stream off the cursor in batches so grouping overlaps the fetch
+            for datum in self.db_ap.select_iter(
+                stmt=SELECT_DATA_SQL,
+                columns=SELECT_DATA_COLUMNS,
+                params=(common.DIRECTORY_ACCEPT, self.from_dir + "%"),
+            ):
+                output.setdefault(datum['target_directory'], []).append(datum)
         finally:
-            self.db_ap.close()
-
-        if self.debug:
-            print(f"output={json.dumps(output, indent=4)}")
-
+            # errors propagate to the caller instead of being swallowed here,
+            # returning an empty result used to make downstream passes
+            # silently write nothing
+            if opened_here:
+                self.db_ap.close()
+
+        # the level check keeps the json serialization off the happy path,
+        # it is only paid when debug logging is actually enabled
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("output=%s", json.dumps(output, indent=4))
+
+        self._grouped_data = output
         return output
 
 class Astrobin(SummaryData):
 
-    def prepare_csv(self) -> dict[str, str]:
+    def prepare_csv(self) -> dict[str, list[dict]]:
         """
-        Prepare CSV data for Astrobin by translating metadata into CSV format.
+        Prepare CSV data for Astrobin by translating metadata into CSV rows.
 
         Returns:
-            dict: A dictionary where the key is the directory and the value is the CSV string.
+            dict: A dictionary where the key is the directory and the value is the list of CSV rows.
         """
 
         output = {}
 
         grouped_data = self.prepare_data()
         for target_directory in grouped_data.keys():
-            translated_data = []
-            for d in grouped_data[target_directory]:
-                # translate data..
-                translated_data.append({
+            # translate data in one comprehension instead of per-row appends
+            output[target_directory] = [
+                {
                     "date": d['date'],
                     "filter": d['filter_astrobinid'],
                     "number": d['accepted_count'],
                     "duration": d['exposureseconds'],
                     "fNumber": d['focal_ratio'],
                     "bortle": d['bortle'],
-                })
-            data_csv = common.simpleObject_to_csv(translated_data, output_headers=True)
-            output[target_directory] = data_csv
+                }
+                for d in grouped_data[target_directory]
+            ]
 
         return output
 
-    def write_csv(self, data: dict[str, str]):
+    def _write_one(self, item):
         """
-        Write the prepared CSV data to files in the corresponding directories.
+        Write one directory's CSV file; the thread pool work unit.
 
         Args:
-            data (dict): A dictionary where the key is the directory and the value is the CSV string.
+            item (tuple): (directory, list of CSV rows).
         """
+        directory, rows = item
+        filename_csv=os.path.join(directory, FILENAME_CSV)
+        try:
+            # stream rows straight to a buffered file handle instead of
+            # materializing the whole csv as one string first
+            with open(filename_csv, "w", newline="", buffering=1<<16) as f:
+                writer = csv.DictWriter(f, fieldnames=ASTROBIN_FIELDS)
+                writer.writeheader()
+                writer.writerows(rows)
+        except Exception as e:
+            print(e)
+            pass
+
+    def write_csv(self, data: dict[str, list[dict]]):
+        """
+        Write the prepared CSV rows to files in the corresponding directories.
 
-        for directory in data.keys():
-            data_csv = data[directory]
-            filename_csv=os.path.join(directory, FILENAME_CSV)
-            if not self.dryrun:
-                try:
-                    with open(filename_csv, "w") as f:
-                        f.write(data_csv)
-                except Exception as e:
-                    print(e)
-                    pass
-            else:
+        Args:
+            data (dict): A dictionary where the key is the directory and the value is the list of CSV rows.
+        """
+
+        if self.dryrun:
+            # sequential so the stdout output stays ordered
+            for directory in data.keys():
                 print("--------------")
-                print(filename_csv)
-                print(data_csv)
+                print(os.path.join(directory, FILENAME_CSV))
+                writer = csv.DictWriter(sys.stdout, fieldnames=ASTROBIN_FIELDS)
+                writer.writeheader()
+                writer.writerows(data[directory])
+            return
+
+        # each directory gets its own file, so overlap the independent writes
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+            list(ex.map(self._write_one, data.items()))
 
 class Totals(SummaryData):
     db_ts:database.Scheduler = None
@@ -184,21 +208,46 @@ class Totals(SummaryData):
         self.from_dir = from_dir
         self.debug = debug
         self.dryrun = dryrun
+        self._grouped_data = None
 
 
-    def prepare_totals(self) -> dict[str, str]:
+    def prepare_totals(self, grouped_data: dict = None) -> dict[str, str]:
         """
         Prepare totals data by calculating desired, available, and needed hours for each target.
 
+        Args:
+            grouped_data (dict): Optional result of an earlier prepare_data()
+                call so the heavy join is not re-executed for this pass.
+
         Returns:
             dict: A dictionary where the key is the directory and the value is a dictionary of totals.
         """
 
+        opened_here = not self.db_ap.isOpen()
+
         try:
-            self.db_ts.open() # to get desired hours
+            if opened_here:
+                self.db_ap.open()
+            # attach the scheduler db to the astrophotography connection so
+            # the desired-hours lookup runs on the same connection instead of
+            # opening a second one
+            self.db_ap.execute("attach database ? as ts;", (self.db_ts.db_filename,))
 
             output = {}
-            grouped_data = self.prepare_data()
+            if grouped_data is None:
+                grouped_data = self.prepare_data()
+
+            # one batched query for every (profile, target) pair instead of a
+            # scheduler-db roundtrip per target directory
+            pairs = [
+                (grouped_data[target_directory][0]['profile_id'], grouped_data[target_directory][0]['targetname'])
+                for target_directory in grouped_data.keys()
+            ]
+            wanted_map = self.db_ts.GetDesiredHoursBulk(pairs, db=self.db_ap, schema="ts.")
+
+            # accepted hours aggregated by the database per (filter, panel)
+            have_map = self.db_ap.GetHaveHours(self.from_dir)
+
             for target_directory in grouped_data.keys():
                 totals = {
                     'have': {
@@ -209,47 +258,63 @@ class Totals(SummaryData):
                         'uom': "hours",
                         'total': 0.0,
                     },
-                    'need': {
-                        'uom': "hours",
-                        'total': 0.0,
-                    },
                 }
                 # want
-                wanted = self.db_ts.GetDesiredHours(grouped_data[target_directory][0]['profile_id'], grouped_data[target_directory][0]['targetname'])
+                wanted = wanted_map.get((grouped_data[target_directory][0]['profile_id'], grouped_data[target_directory][0]['targetname']), {})
                 for filtername in wanted.keys():
                     totals['want'][filtername] = wanted[filtername]
                     totals['want']['total'] += totals['want'][filtername]
 
-                # have
-                for datum in grouped_data[target_directory]:
-                    h = round(int(datum['accepted_count']) * float(datum['exposureseconds']) / 60 / 60, 1)
-                    k = f"{datum['filter_name']}"
-                    if 'panelname' in datum and len(datum['panelname']) > 0:
-                        k = f"{datum['filter_name']} Panel {datum['panelname']}"
-                    if k not in totals['have']:
-                        totals['have'][k] = h
-                    else:
-                        totals['have'][k] += h
+                # have; the count*seconds sums come pre-aggregated from the
+                # database, only display-key formatting happens here
+                for (filtername, panelname), hours in have_map.get(target_directory, {}).items():
+                    h = round(hours, 1)
+                    k = f"{filtername} Panel {panelname}" if panelname else filtername
+                    totals['have'][k] = h
                     totals['have']['total'] += h
 
-                # need
-                for k in totals['want']:
-                    if k in ['total', 'uom']:
-                        continue
-                    if k in totals['have'] and totals['want'][k] > totals['have'][k]:
-                        totals['need'][k] = round(totals['want'][k] - totals['have'][k], 1)
-                        totals['need']['total'] += totals['need'][k]
-                    elif k not in totals['have']:
-                        totals['need'][k] = round(totals['want'][k], 1)
-                        totals['need']['total'] += totals['need'][k]
+                # need; one pass over the filter keys, keeping only positive
+                # shortfalls, instead of the nested membership branches;
+                # iterate the dict itself so want's insertion order is kept
+                want = totals['want']
+                have = totals['have']
+                need = {
+                    k: round(want[k] - have.get(k, 0.0), 1)
+                    for k in want
+                    if k not in ('total', 'uom') and want[k] > have.get(k, 0.0)
+                }
+                need['total'] = sum(need.values())
+                need['uom'] = "hours"
+                totals['need'] = need
 
                 output[target_directory] = totals
         finally:
-            self.db_ts.close()
-            self.db_ap.close()
+            self.db_ap.execute("detach database ts;")
+            if opened_here:
+                self.db_ap.close()
 
         return output
 
+    def _write_one(self, item):
+        """
+        Write one directory's totals file; the thread pool work unit.
+
+        Args:
+            item (tuple): (directory, totals dict).
+        """
+        directory, totals = item
+        filename_total=os.path.join(directory, FILENAME_TOTALS)
+        try:
+            # stream json to a temp file and rename into place so a crash
+            # mid-write never leaves a truncated totals file behind
+            filename_tmp = filename_total + ".tmp"
+            with open(filename_tmp, "w") as f:
+                json.dump(totals, f, indent=4)
+            os.replace(filename_tmp, filename_total)
+        except Exception as e:
+            print(e)
+            pass
+
     def write_totals(self, data: dict[str, str]):
         """
         Write the prepared totals data to files in the corresponding directories.
@@ -258,26 +323,24 @@ class Totals(SummaryData):
             data (dict): A dictionary where the key is the directory and the value is the totals data.
         """
 
-        for directory in data.keys():
-            totals = data[directory]
-            filename_total=os.path.join(directory, FILENAME_TOTALS)
-            data_total = ""
-            for key in totals.keys():
-                value = totals[key]
-                if type(value) is float:
-                    value = '{:.2f}'.format(value)
-                data_total += f"{key} = {value}\n"
-            if not self.dryrun:
-                try:
-                    with open(filename_total, "w") as f:
-                        f.write(json.dumps(totals, indent=4))
-                except Exception as e:
-                    print(e)
-                    pass
-            else:
+        if self.dryrun:
+            # sequential so the stdout output stays ordered
+            for directory in data.keys():
+                totals = data[directory]
+                data_total = ""
+                for key in totals.keys():
+                    value = totals[key]
+                    if type(value) is float:
+                        value = '{:.2f}'.format(value)
+                    data_total += f"{key} = {value}\n"
                 print("--------------")
-                print(filename_total)
+                print(os.path.join(directory, FILENAME_TOTALS))
                 print(data_total)
+            return
+
+        # each directory gets its own file, so overlap the independent writes
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+            list(ex.map(self._write_one, data.items()))
 
 class Metadata():
     pass
@@ -302,21 +365,32 @@ if __name__ == "__main__":
     user_debug = args["debug"]
     user_dryrun = args["dryrun"]
 
-    a = Astrobin(
-        db_ap=database.Astrophotgraphy(common.DATABASE_ASTROPHOTGRAPHY),
-        from_dir=user_fromdir,
-        debug=user_debug,
-        dryrun=user_dryrun,
-    )
-    data=a.prepare_csv()
-    a.write_csv(data)
-
-    t = Totals(
-        db_ap=database.Astrophotgraphy(common.DATABASE_ASTROPHOTGRAPHY),
-        db_ts=database.Scheduler(common.DATABASE_TARGET_SCHEDULER),
-        from_dir=user_fromdir,
-        debug=user_debug,
-        dryrun=user_dryrun,
-    )
-    data=t.prepare_totals()
-    t.write_totals(data)
\ No newline at end of file
+    logging.basicConfig(level=logging.DEBUG if user_debug else logging.INFO, format="%(message)s")
+
+    try:
+        # one shared connection for both passes instead of open/close per pass
+        with database.Astrophotgraphy(common.DATABASE_ASTROPHOTGRAPHY) as db_ap:
+            a = Astrobin(
+                db_ap=db_ap,
+                from_dir=user_fromdir,
+                debug=user_debug,
+                dryrun=user_dryrun,
+            )
+            data=a.prepare_csv()
+            a.write_csv(data)
+
+            t = Totals(
+                db_ap=db_ap,
+                db_ts=database.Scheduler(common.DATABASE_TARGET_SCHEDULER),
+                from_dir=user_fromdir,
+                debug=user_debug,
+                dryrun=user_dryrun,
+            )
+            # hand the totals pass the data already fetched for the csv pass so
+            # the heavy join only executes once per script run
+            data=t.prepare_totals(a.prepare_data())
+            t.write_totals(data)
+    except Exception as e:
+        print(e)
+        traceback.print_exc()
+        sys.exit(1)
\ No newline at end of file